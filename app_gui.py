@@ -1,8 +1,9 @@
 import tkinter as tk
 from tkinter import scrolledtext
+import sqlite3
 import threading
-import time
-import main as scraper_main  # Import main.py as a module
+import main2 as scraper_main  # Storage helpers for the scraped_data table
+from scraper import run_jobs, scrape_stats
 
 # List of 10 URLs to scrape. You can customize these URLs.
 URLS = [
@@ -27,19 +28,30 @@ def update_log(log_widget: scrolledtext.ScrolledText, msg: str) -> None:
     log_widget.configure(state='disabled')
     log_widget.yview(tk.END)
 
+# Number of URLs scraped at the same time.
+CONCURRENCY = 5
+
 def scrape_all(log_widget: scrolledtext.ScrolledText) -> None:
     """
-    Loop through the list of URLs, scrape each one by calling main.main(url),
+    Scrape all URLs concurrently, store each result as soon as it finishes,
     and update the log widget with the progress.
     """
-    for url in URLS:
-        update_log(log_widget, f"Starting scrape for: {url}")
-        # Call the main function from main.py to scrape the URL and store the result.
-        scraper_main.main(url)
-        update_log(log_widget, f"Finished scraping: {url}")
-        # Optional: sleep briefly between scrapes to avoid hammering servers.
-        time.sleep(1)
-    update_log(log_widget, "All scraping completed.")
+    conn = sqlite3.connect(scraper_main.DB_FILE)
+    scraper_main.create_table(conn)
+    # Look validators up here: the connection belongs to this thread.
+    previous = {url: scraper_main.previous_scrape(conn, url) for url in URLS}
+    update_log(log_widget, f"Starting scrape of {len(URLS)} URLs.")
+    for url, result in run_jobs(URLS, concurrency=CONCURRENCY, previous=previous.get):
+        scraper_main.store_result(conn, result)
+        status = "unchanged" if result.get("not_modified") else "finished"
+        update_log(log_widget, f"Scrape {status}: {url}")
+    conn.close()
+    counts = scrape_stats.snapshot()
+    update_log(
+        log_widget,
+        f"All scraping completed: {counts['processed']} processed, "
+        f"{counts['skipped']} unchanged, {counts['failed']} failed.",
+    )
 
 def start_scraping(log_widget: scrolledtext.ScrolledText) -> None:
     """
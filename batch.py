@@ -0,0 +1,644 @@
+# file_path/batch.py
+
+import os
+import abc
+import sys
+import json
+import bisect
+import time
+import argparse
+import logging
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+import db_config
+import main2
+from formatter import iter_urls
+from ingest import PostgresSource, SQLiteSource
+from scraper import DEFAULT_CONCURRENCY, DEFAULT_FRESHNESS_TTL, DEFAULT_HOST_BURST, DEFAULT_HOST_MAX_IN_FLIGHT, DEFAULT_HOST_RATE, BloomFilter, JobRunner, canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress updates on a terminal; when stderr is redirected
+# a progress line is logged every PROGRESS_LOG_INTERVAL seconds instead.
+PROGRESS_INTERVAL = 1.0
+PROGRESS_LOG_INTERVAL = 30.0
+# Throughput (and so the ETA) is measured over this many recent seconds.
+RATE_WINDOW = 30.0
+# Seconds between making progress durable: the output is flushed, then the
+# checkpoint file is saved or the finished source rows are acknowledged.
+CHECKPOINT_INTERVAL = 10.0
+SOURCE_BATCH_SIZE = 100
+
+
+def job_status(result: Dict[str, Any]) -> str:
+    """Status recorded with an output row, as in the app's jobs list."""
+    return "completed" if result.get("metadata", {}).get("statusCode") == 200 else "error"
+
+
+class Checkpoint:
+    """
+    Progress through an ordered input, saved so an interrupted run resumes
+    where it stopped.
+
+    Results finish out of order, so the checkpoint keeps the position below
+    which every item is done plus the done items past it as merged ranges;
+    a slow item holding the position back while later ones finish adds one
+    range, not one entry per item. Items whose output could not be stored
+    are listed separately and count as done for the position, so one bad
+    row does not pin it for the rest of the run; a resumed run retries them.
+    """
+
+    def __init__(self, path: str, input_name: str):
+        """
+        Args:
+            path (str): Checkpoint file; loaded if it exists.
+            input_name (str): Identifies the input, so a checkpoint is not
+                applied to a different one.
+
+        Raises:
+            ValueError: If the checkpoint was written for another input.
+        """
+        self.path = path
+        self.input_name = input_name
+        self.done_below = 0
+        # Done ranges past done_below, [start, end), indexed by both ends so
+        # marking an item merges it with its neighbours in constant time.
+        self._ends_by_start: Dict[int, int] = {}
+        self._starts_by_end: Dict[int, int] = {}
+        self._covered = 0
+        self.failed: Set[int] = set()
+        self._retry: FrozenSet[int] = frozenset()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("input") != input_name:
+                raise ValueError(f"{path} is a checkpoint for {state.get('input')!r}, not {input_name!r}")
+            self.done_below = state["done_below"]
+            for start, end in state.get("done_ranges", []):
+                self._covered += end - start
+                self._store(start, end)
+            # Checkpoints written before ranges listed every index.
+            for index in state.get("done_above", []):
+                self._cover(index)
+            self.failed = set(state.get("failed", []))
+            self._retry = frozenset(self.failed)
+        # What was done when the run started, for is_done() on the feeding
+        # thread while results are marked on others.
+        self._resumed_below = self.done_below
+        self._resumed = sorted(self._ends_by_start.items())
+
+    def __len__(self) -> int:
+        return self.done_below + self._covered - len(self.failed)
+
+    def is_done(self, index: int) -> bool:
+        """Whether an earlier run stored the item's output."""
+        if index in self._retry:
+            return False
+        if index < self._resumed_below:
+            return True
+        position = bisect.bisect_right(self._resumed, (index, float("inf"))) - 1
+        return position >= 0 and index < self._resumed[position][1]
+
+    def mark(self, index: int) -> None:
+        """Record an item whose output is stored."""
+        self._cover(index)
+        self.failed.discard(index)
+
+    def fail(self, index: int) -> None:
+        """Record an item whose output could not be stored."""
+        self._cover(index)
+        self.failed.add(index)
+
+    def _cover(self, index: int) -> None:
+        # Items being retried were covered when they first failed.
+        if index < self.done_below or index in self._retry:
+            return
+        start = self._starts_by_end.pop(index, index)
+        if start != index:
+            del self._ends_by_start[start]
+        end = self._ends_by_start.pop(index + 1, index + 1)
+        if end != index + 1:
+            del self._starts_by_end[end]
+        self._covered += 1
+        self._store(start, end)
+
+    def _store(self, start: int, end: int) -> None:
+        if start <= self.done_below:
+            self._covered -= end - start
+            self.done_below = max(self.done_below, end)
+        else:
+            self._ends_by_start[start] = end
+            self._starts_by_end[end] = start
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "input": self.input_name,
+            "done_below": self.done_below,
+            "done_ranges": sorted([start, end] for start, end in self._ends_by_start.items()),
+            "failed": sorted(self.failed),
+        }
+
+    def save(self, state: Dict[str, Any]) -> None:
+        """
+        Write a ``state()`` snapshot, replacing the file atomically.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class _Output(abc.ABC):
+    """Where finished results go. ``write`` is called from worker threads."""
+
+    def previous(self, url: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def is_fresh(self, url: str) -> bool:
+        return False
+
+    @abc.abstractmethod
+    def write(self, key: int, url: str, result: Dict[str, Any]) -> None:
+        """Store a result, or queue it to be stored by the next ``flush``."""
+
+    def flush(self) -> Set[int]:
+        """
+        Store everything written so far.
+
+        Returns:
+            set: Keys whose queued write failed since the last flush.
+        """
+        return set()
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteOutput(_Output):
+    """
+    The scraped_data table, written through one batching writer. URLs
+    scraped successfully within ``fresh_for`` seconds are skipped, and
+    older ones are re-fetched conditionally, as in ``main2.main``.
+    """
+
+    def __init__(self, path: str, fresh_for: float = DEFAULT_FRESHNESS_TTL):
+        # Only the feeding thread reads through this connection.
+        self._conn = sqlite3.connect(path)
+        main2.create_table(self._conn)
+        self._writer = db_config.SQLiteWriter(path, wal=True, on_error=self._write_failed)
+        self.fresh_for = fresh_for
+        self._failed: Set[int] = set()
+        self._failed_lock = threading.Lock()
+
+    def previous(self, url: str) -> Optional[Dict[str, Any]]:
+        return main2.previous_scrape(self._conn, url)
+
+    def is_fresh(self, url: str) -> bool:
+        return self.fresh_for > 0 and main2.recently_scraped(self._conn, url, self.fresh_for)
+
+    def write(self, key: int, url: str, result: Dict[str, Any]) -> None:
+        # One queued call per result, so a failure is reported with its key.
+        self._writer.call(_store_result, key, main2.result_statements(result))
+
+    def _write_failed(self, op: Any, args: Tuple) -> None:
+        with self._failed_lock:
+            self._failed.add(args[0])
+
+    def flush(self) -> Set[int]:
+        self._writer.flush()
+        with self._failed_lock:
+            failed, self._failed = self._failed, set()
+        return failed
+
+    def close(self) -> None:
+        self._writer.close()
+        self._conn.close()
+
+
+def _store_result(conn: sqlite3.Connection, key: int, statements: List[Tuple[str, tuple]]) -> None:
+    for sql, params in statements:
+        conn.execute(sql, params)
+
+
+class PostgresOutput(_Output):
+    """An output table in PostgreSQL, in the layout the app writes."""
+
+    def __init__(self, table: str, host: str, port: int, database: str, user: str, password: str):
+        self._sink = db_config.PostgresSink(host, port, database, user, password, on_error=self._write_failed)
+        self.table = table
+        self._failed: Set[int] = set()
+        self._failed_lock = threading.Lock()
+
+    def write(self, key: int, url: str, result: Dict[str, Any]) -> None:
+        self._sink.store(self.table, {"id": key, "url": url, "response": result, "status": job_status(result)})
+
+    def _write_failed(self, table_name: str, row: Tuple) -> None:
+        with self._failed_lock:
+            self._failed.add(row[0])
+
+    def flush(self) -> Set[int]:
+        self._sink.flush()
+        with self._failed_lock:
+            failed, self._failed = self._failed, set()
+        return failed
+
+    def close(self) -> None:
+        self._sink.close()
+
+
+class JSONLinesOutput(_Output):
+    """One JSON object per result, appended to a file or written to stdout."""
+
+    def __init__(self, path: str):
+        self._to_stdout = path == "-"
+        self._file = sys.stdout if self._to_stdout else open(path, "a", encoding="utf-8")
+        # Pipes and devices cannot be synced.
+        self._sync = not self._to_stdout and os.path.isfile(path)
+        self._lock = threading.Lock()
+
+    def write(self, key: int, url: str, result: Dict[str, Any]) -> None:
+        line = json.dumps({"url": url, **result}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def flush(self) -> Set[int]:
+        # Write errors are raised by write() or here, not reported per key.
+        with self._lock:
+            self._file.flush()
+            if self._sync:
+                os.fsync(self._file.fileno())
+        return set()
+
+    def close(self) -> None:
+        self.flush()
+        if not self._to_stdout:
+            self._file.close()
+
+
+def read_url_file(path: str) -> Iterable[str]:
+    """
+    Stream the URLs of a file.
+
+    Args:
+        path (str): A .txt file with one URL per line, a .csv/.xlsx file with
+            URLs in the first column (any of them optionally gzipped), or
+            ``-`` for stdin.
+
+    Returns:
+        iterable: The URLs in input order, read as they are consumed.
+    """
+    if path == "-":
+        return (line.strip() for line in sys.stdin if line.strip())
+    return iter_urls(path)
+
+
+def count_urls(path: str, run: "BatchRun", already_done: int = 0) -> None:
+    """Count a file's URLs in a second pass and give the run its total."""
+    try:
+        run.total = sum(1 for _ in iter_urls(path)) - already_done
+    except Exception as ex:
+        logger.warning(f"Could not count the URLs in {path}: {ex}")
+
+
+def claimed_rows(source: Any, batch_size: int = SOURCE_BATCH_SIZE) -> Iterator[Tuple[int, str]]:
+    """Claim and yield ``(id, url)`` rows of a source until none are left."""
+    while True:
+        rows = source.fetch(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class BatchRun:
+    """
+    One headless crawl.
+
+    URLs are fed to a ``JobRunner`` (which blocks the feed while its backlog
+    is full, so inputs of any size run in bounded memory) and each result is
+    written to the output as soon as it finishes. A reporter thread prints
+    throughput and ETA and periodically makes progress durable: the output
+    is flushed first, then the checkpoint is saved or the finished source
+    rows are acknowledged, so nothing is marked done before its output is
+    stored. A result whose write fails is never marked done; it is scraped
+    again on resume (or, for source rows, once this run's leases run out).
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        output: _Output,
+        checkpoint: Optional[Checkpoint] = None,
+        source: Any = None,
+        total: Optional[int] = None,
+        stream: Any = None,
+        dedup: bool = True,
+    ):
+        """
+        Args:
+            runner (JobRunner): Scrapes the URLs.
+            output (_Output): Stores the results.
+            checkpoint (Checkpoint, optional): Progress of a file input; keys
+                are input positions.
+            source (optional): A claimed ``SQLiteSource``/``PostgresSource``;
+                keys are row ids, acknowledged once stored.
+            total (int, optional): URLs left to scrape, for the ETA.
+            stream (optional): Where progress goes. Defaults to stderr.
+            dedup (bool): Skip URLs whose canonical form was seen earlier in
+                the run. URLs fresh in the output are skipped either way.
+        """
+        self.runner = runner
+        self.output = output
+        self.checkpoint = checkpoint
+        self.source = source
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.counts = {"done": 0, "failed": 0, "unchanged": 0, "duplicate": 0, "unsaved": 0}
+        # A few bytes per URL, so inputs of any length can be deduplicated;
+        # a false positive (about one in a million) skips a URL.
+        self.seen = BloomFilter() if dedup else None
+        self._submitted = 0
+        # Keys finished since the last save, marked done once the output
+        # confirms their writes.
+        self._written: List[int] = []
+        self._lock = threading.Condition()
+        self._stopped = threading.Event()
+        self._started = time.monotonic()
+        self._samples = deque([(self._started, 0)])
+        self._interactive = self.stream.isatty()
+
+    def run(self, items: Iterable[Tuple[int, str]]) -> bool:
+        """
+        Scrape every ``(key, url)`` item and wait for the results.
+
+        Returns:
+            bool: True if every item finished, False if interrupted.
+        """
+        reporter = threading.Thread(target=self._report_loop, name="batch-reporter", daemon=True)
+        reporter.start()
+        finished = False
+        try:
+            for key, url in items:
+                with self._lock:
+                    self._submitted += 1
+                if self._is_duplicate(url):
+                    self._done(key, duplicate=True)
+                    continue
+                self.runner.submit(
+                    url,
+                    callback=lambda url, result, key=key: self._record(key, url, result),
+                    previous=self.output.previous(url),
+                )
+            with self._lock:
+                while self.counts["done"] < self._submitted:
+                    self._lock.wait()
+            finished = True
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; saving progress of the finished URLs")
+        finally:
+            self._stopped.set()
+            reporter.join()
+            self.save()
+            self._report(final=True)
+        return finished
+
+    def _is_duplicate(self, url: str) -> bool:
+        if self.seen is not None and not self.seen.add(canonicalize_url(url)):
+            return True
+        # Independent of dedup; the output's freshness window turns it off.
+        return self.output.is_fresh(url)
+
+    def _record(self, key: int, url: str, result: Dict[str, Any]) -> None:
+        if self._stopped.is_set():
+            # Interrupted: progress is saved and the output is closing, so
+            # jobs still in flight are left to the next run.
+            return
+        try:
+            self.output.write(key, url, result)
+        except Exception as ex:
+            logger.error(f"Error writing the result of {url}: {ex}")
+            self._done(key, failed=True, stored=False)
+            return
+        self._done(key, failed=bool(result.get("error")), unchanged=bool(result.get("not_modified")))
+
+    def _done(
+        self,
+        key: int,
+        failed: bool = False,
+        unchanged: bool = False,
+        duplicate: bool = False,
+        stored: bool = True,
+    ) -> None:
+        with self._lock:
+            self.counts["done"] += 1
+            self.counts["failed"] += failed
+            self.counts["unchanged"] += unchanged and not failed
+            self.counts["duplicate"] += duplicate
+            self.counts["unsaved"] += not stored
+            if stored:
+                self._written.append(key)
+            elif self.checkpoint is not None:
+                self.checkpoint.fail(key)
+            self._lock.notify_all()
+
+    def save(self) -> None:
+        """Flush the output, then record what it now durably holds."""
+        with self._lock:
+            written, self._written = self._written, []
+        try:
+            failed = self.output.flush()
+        except Exception as ex:
+            # Nothing written since the last save is known to be stored, so
+            # it is marked done only once a later flush succeeds.
+            logger.error(f"Error flushing output: {ex}")
+            with self._lock:
+                self._written[:0] = written
+            return
+        stored = [key for key in written if key not in failed]
+        state = None
+        with self._lock:
+            self.counts["unsaved"] += len(written) - len(stored)
+            if self.checkpoint is not None:
+                for key in written:
+                    if key in failed:
+                        self.checkpoint.fail(key)
+                    else:
+                        self.checkpoint.mark(key)
+                state = self.checkpoint.state()
+        try:
+            if state is not None:
+                self.checkpoint.save(state)
+            elif self.source is not None and stored:
+                self.source.ack(stored)
+        except Exception as ex:
+            # The checkpoint keeps the marks for its next save; unacknowledged
+            # rows are acknowledged then instead.
+            logger.error(f"Error saving progress: {ex}")
+            if state is None:
+                with self._lock:
+                    self._written.extend(stored)
+
+    def _report_loop(self) -> None:
+        interval = PROGRESS_INTERVAL if self._interactive else PROGRESS_LOG_INTERVAL
+        last_save = time.monotonic()
+        while not self._stopped.wait(interval):
+            self._report()
+            if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+                self.save()
+                last_save = time.monotonic()
+
+    def _report(self, final: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            counts = dict(self.counts)
+        self._samples.append((now, counts["done"]))
+        while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+            self._samples.popleft()
+        start, done_then = self._samples[0]
+        rate = (counts["done"] - done_then) / (now - start) if now > start else 0.0
+        progress = f"{counts['done']}/{self.total}" if self.total is not None else str(counts["done"])
+        line = (
+            f"{progress} done, {counts['failed']} failed, {counts['unchanged']} unchanged, "
+            f"{counts['duplicate']} duplicates, "
+            f"{rate:.1f} URLs/s, elapsed {_format_duration(now - self._started)}"
+        )
+        if counts["unsaved"]:
+            line += f", {counts['unsaved']} not saved"
+        if not final and self.total is not None and rate > 0:
+            line += f", ETA {_format_duration(max(0, self.total - counts['done']) / rate)}"
+        if self._interactive:
+            self.stream.write("\r\033[K" + line + ("\n" if final else ""))
+            self.stream.flush()
+        else:
+            logger.info(line)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Scrape URLs without a GUI and store the results.",
+    )
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--urls", metavar="FILE",
+                        help="URLs to scrape: .txt (one per line), .csv/.xlsx (first column), or - for stdin")
+    inputs.add_argument("--source", choices=("sqlite", "postgres"),
+                        help="claim URLs from a table (see --table, --column); several runs can share it")
+    parser.add_argument("--table", help="source table, with an integer id column")
+    parser.add_argument("--column", help="source column holding the URLs")
+    parser.add_argument("--sqlite-path", help="SQLite file of the source table")
+    parser.add_argument("--lease", type=float, default=db_config.DEFAULT_LEASE_SECONDS,
+                        help="seconds a claimed source row stays reserved without a heartbeat")
+
+    parser.add_argument("--output", choices=("sqlite", "postgres", "jsonl"), default="sqlite",
+                        help="where results go (default: the scraped_data table in sqlite)")
+    parser.add_argument("--output-path",
+                        help=f"SQLite file (default {main2.DB_FILE}) or JSONL file (default - for stdout)")
+    parser.add_argument("--output-table", default="scrape_output",
+                        help="PostgreSQL output table (default scrape_output, as in the app)")
+
+    parser.add_argument("--pg-host", default="localhost")
+    parser.add_argument("--pg-port", type=int, default=5432)
+    parser.add_argument("--pg-database", default="postgres")
+    parser.add_argument("--pg-user", default="postgres")
+    parser.add_argument("--pg-password", default=os.environ.get("PGPASSWORD", ""))
+
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"URLs fetched at the same time (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--parse-workers", type=int,
+                        help="parser processes (default: one per CPU; 0 parses in the fetch threads)")
+    parser.add_argument("--host-rate", type=float, default=DEFAULT_HOST_RATE, metavar="PER_SECOND",
+                        help=f"requests per second sent to any one host (default {DEFAULT_HOST_RATE:g})")
+    parser.add_argument("--host-burst", type=float, default=DEFAULT_HOST_BURST,
+                        help=f"requests a host may receive back to back (default {DEFAULT_HOST_BURST})")
+    parser.add_argument("--host-max-in-flight", type=int, default=DEFAULT_HOST_MAX_IN_FLIGHT, metavar="N",
+                        help=f"concurrent requests to any one host (default {DEFAULT_HOST_MAX_IN_FLIGHT})")
+    parser.add_argument("--fresh-for", type=float, default=DEFAULT_FRESHNESS_TTL, metavar="SECONDS",
+                        help="skip URLs the sqlite output scraped successfully this recently (0 to disable)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="scrape repeated URLs (and their variants) every time they appear; "
+                             "see --fresh-for for URLs scraped by earlier runs")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="save progress through --urls here and resume from it when rerun")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.source and not (args.table and args.column):
+        parser.error("--source needs --table and --column")
+    if args.source == "sqlite" and not args.sqlite_path:
+        parser.error("--source sqlite needs --sqlite-path")
+    if args.source and args.checkpoint:
+        parser.error("--checkpoint applies to --urls; claimed source rows are checkpointed in their table")
+    if args.host_rate <= 0 or args.host_burst < 1 or args.host_max_in_flight < 1:
+        parser.error("--host-rate must be positive and --host-burst and --host-max-in-flight at least 1")
+    if args.checkpoint and args.urls == "-":
+        logger.warning("Resuming from --checkpoint assumes stdin replays the same URLs in the same order")
+    pg = (args.pg_host, args.pg_port, args.pg_database, args.pg_user, args.pg_password)
+
+    checkpoint = source = None
+    total = None
+    if args.urls:
+        urls = read_url_file(args.urls)
+        if args.checkpoint:
+            try:
+                checkpoint = Checkpoint(args.checkpoint, os.path.abspath(args.urls) if args.urls != "-" else "-")
+            except ValueError as ex:
+                parser.error(str(ex))
+            if len(checkpoint):
+                logger.info(f"Resuming: {len(checkpoint)} URLs already done")
+            if checkpoint.failed:
+                logger.info(f"Retrying {len(checkpoint.failed)} URLs whose output could not be stored")
+            items = ((index, url) for index, url in enumerate(urls) if not checkpoint.is_done(index))
+        else:
+            items = enumerate(urls)
+    else:
+        if args.source == "sqlite":
+            source = SQLiteSource(args.sqlite_path, args.table, args.column, args.lease)
+        else:
+            source = PostgresSource(*pg, args.table, args.column, args.lease)
+        total = source.remaining()
+        items = claimed_rows(source)
+
+    if args.output == "sqlite":
+        output = SQLiteOutput(args.output_path or main2.DB_FILE, args.fresh_for)
+    elif args.output == "postgres":
+        output = PostgresOutput(args.output_table, *pg)
+    else:
+        output = JSONLinesOutput(args.output_path or "-")
+
+    runner = JobRunner(
+        args.concurrency,
+        parse_workers=args.parse_workers,
+        host_rate=args.host_rate,
+        host_burst=args.host_burst,
+        host_max_in_flight=args.host_max_in_flight,
+    )
+    finished = False
+    run = BatchRun(runner, output, checkpoint, source, total, dedup=not args.no_dedup)
+    if args.urls and args.urls != "-":
+        # Scraping starts right away; the ETA appears once the count is in.
+        threading.Thread(
+            target=count_urls, args=(args.urls, run, len(checkpoint) if checkpoint else 0), daemon=True
+        ).start()
+    try:
+        finished = run.run(items)
+    finally:
+        runner.shutdown(wait=finished)
+        output.close()
+        if source is not None:
+            source.close()
+    return 0 if finished else 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
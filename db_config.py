@@ -1,13 +1,47 @@
 # file_path/db_config.py
+import os
+import time
+import uuid
+import queue
+import socket
+import logging
 import sqlite3
+import threading
+from itertools import groupby
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Source rows claimed by a worker stay reserved for this long unless the
+# worker renews the lease; a crashed worker's rows become claimable again.
+DEFAULT_LEASE_SECONDS = 300
+CLAIM_COLUMNS_SQLITE = {"scrape_state": "TEXT", "scrape_owner": "TEXT", "scrape_lease_until": "REAL"}
+CLAIM_COLUMNS_POSTGRES = {"scrape_state": "TEXT", "scrape_owner": "TEXT", "scrape_lease_until": "TIMESTAMPTZ"}
+
+def worker_id():
+    # Recorded on every lease this process takes.
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
 # --- SQLite Functions ---
-def connect_sqlite(db_path):
+def connect_sqlite(db_path, wal=False):
     # Allow SQLite connection objects to be shared across threads.
     conn = sqlite3.connect(db_path, check_same_thread=False)
+    tune_sqlite(conn, wal=wal)
     return conn
 
+def tune_sqlite(conn, cache_mb=64, wal=False):
+    # WAL lets readers run alongside the writer, and with synchronous=NORMAL
+    # a commit no longer waits for an fsync. WAL is a lasting property of
+    # the file, so only ask for it on databases this tool owns; the user's
+    # own databases keep their journal mode.
+    if wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+    conn.execute("PRAGMA busy_timeout=5000")
+
 
 def get_tables_sqlite(conn):
     cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -25,6 +59,58 @@ def fetch_urls_sqlite(conn, table, url_column, batch_size=100, last_id=0):
     rows = cursor.fetchall()
     return rows
 
+# Claims: a row is free (scrape_state NULL), claimed by a worker until its
+# lease expires, or done once its output has been stored.
+def ensure_claim_columns_sqlite(conn, table):
+    # Take the write lock before looking, so workers starting together
+    # don't both try to add the same column.
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    existing = set(get_columns_sqlite(conn, table))
+    for column, column_type in CLAIM_COLUMNS_SQLITE.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    # Only unfinished rows are indexed, so claiming never scans done rows.
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_scrape_queue ON {table} (id) "
+                 f"WHERE scrape_state IS NULL OR scrape_state = 'claimed'")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_scrape_owner ON {table} (scrape_owner) "
+                 f"WHERE scrape_state = 'claimed'")
+    conn.commit()
+
+def claim_urls_sqlite(conn, table, url_column, batch_size, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+    # One UPDATE ... RETURNING, so concurrent workers never get the same row.
+    now = time.time()
+    with conn:
+        rows = conn.execute(f"""
+        UPDATE {table} SET scrape_state = 'claimed', scrape_owner = ?, scrape_lease_until = ?
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE (scrape_state IS NULL OR scrape_state = 'claimed') AND COALESCE(scrape_lease_until, 0) < ?
+            ORDER BY id LIMIT ?
+        )
+        RETURNING id, {url_column}
+        """, (owner, now + lease_seconds, now, batch_size)).fetchall()
+    return sorted(rows)
+
+def renew_claims_sqlite(conn, table, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+    with conn:
+        conn.execute(f"UPDATE {table} SET scrape_lease_until = ? WHERE scrape_state = 'claimed' AND scrape_owner = ?",
+                     (time.time() + lease_seconds, owner))
+
+def ack_claims_sqlite(conn, table, ids):
+    conn.executemany(f"UPDATE {table} SET scrape_state = 'done', scrape_lease_until = NULL WHERE id = ?",
+                     [(row_id,) for row_id in ids])
+
+def release_claims_sqlite(conn, table, ids):
+    # Give claimed rows back, e.g. when their output could not be stored.
+    conn.executemany(f"UPDATE {table} SET scrape_state = NULL, scrape_owner = NULL, scrape_lease_until = NULL "
+                     f"WHERE id = ? AND scrape_state = 'claimed'", [(row_id,) for row_id in ids])
+
+def count_unclaimed_sqlite(conn, table):
+    # Rows not done yet, including ones leased to other workers.
+    return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE scrape_state IS NULL OR scrape_state = 'claimed'"
+                        ).fetchone()[0]
+
 def create_output_table_sqlite(conn, table_name):
     conn.execute(f"""
     CREATE TABLE IF NOT EXISTS {table_name} (
@@ -35,13 +121,124 @@ def create_output_table_sqlite(conn, table_name):
         status TEXT
     )
     """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_url ON {table_name} (url)")
     conn.commit()
 
+def output_row(job):
+    return (job['id'], job['url'], job['response'].get('markdown', ''), job['status'])
+
 def store_output_sqlite(conn, table_name, job):
     conn.execute(f"INSERT INTO {table_name} (job_id, url, response, status) VALUES (?, ?, ?, ?)",
-                 (job['id'], job['url'], job['response'].get('markdown', ''), job['status']))
+                 output_row(job))
     conn.commit()
 
+def queue_output_sqlite(writer, table_name, job, ack=None):
+    # ack=(source_table, row_ids) marks the claimed source rows done in the
+    # same transaction as their output. A failed write reaches the writer's
+    # on_error as (write_output_sqlite, (table_name, row, ack)).
+    writer.call(write_output_sqlite, table_name, output_row(job), ack)
+
+def write_output_sqlite(conn, table_name, row, ack=None):
+    conn.execute(f"INSERT INTO {table_name} (job_id, url, response, status) VALUES (?, ?, ?, ?)", row)
+    if ack is not None:
+        ack_claims_sqlite(conn, ack[0], ack[1])
+
+
+# --- Batched SQLite Writer ---
+class SQLiteWriter:
+    """
+    Owns the only writing connection to a SQLite file and applies queued
+    writes from a background thread, batch_size at a time or every
+    flush_interval seconds, each batch in one transaction. Consecutive
+    writes of the same statement go through a single executemany().
+
+    If a batch fails it is retried one write at a time. A write that still
+    fails is reported to on_error(op, params) on the writer thread, op being
+    the statement or function queued.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path, batch_size=500, flush_interval=0.25, max_pending=10000, wal=False, on_error=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        # Only the writer thread uses this connection after start-up.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        tune_sqlite(self.conn, wal=wal)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def execute(self, sql, params=()):
+        # Blocks only when max_pending writes are already waiting.
+        self._queue.put((sql, params))
+
+    def call(self, fn, *args):
+        # Runs fn(conn, *args) on the writer thread inside the current batch.
+        # The writer owns the transaction, so fn must not commit.
+        self._queue.put((fn, args))
+
+    def flush(self):
+        done = threading.Event()
+        self._queue.put((None, done))
+        done.wait()
+
+    def close(self):
+        self.flush()
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self.conn.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and item[0] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        writes = [item for item in batch if item[0] is not None]
+        try:
+            with self.conn:
+                self._apply(writes)
+        except Exception as ex:
+            # Retry one by one so a single bad row does not drop the batch.
+            logger.error(f"Batch of {len(writes)} SQLite writes failed ({ex}); retrying individually")
+            for write in writes:
+                try:
+                    with self.conn:
+                        self._apply([write])
+                except Exception as ex:
+                    logger.error(f"Error writing to SQLite: {ex}")
+                    if self.on_error:
+                        self.on_error(*write)
+        for op, done in batch:
+            if op is None:
+                done.set()
+
+    def _apply(self, writes):
+        for op, group in groupby(writes, key=lambda write: write[0]):
+            if callable(op):
+                for _, args in group:
+                    op(self.conn, *args)
+            else:
+                self.conn.executemany(op, [params for _, params in group])
+
 
 # --- PostgreSQL Functions ---
 def connect_postgres(host, port, database, user, password):
@@ -73,6 +270,61 @@ def fetch_urls_postgres(conn, table, url_column, batch_size=100, last_id=0):
     cursor.close()
     return rows
 
+def ensure_claim_columns_postgres(conn, table):
+    with conn, conn.cursor() as cursor:
+        # Workers starting together would collide on the catalog otherwise.
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"scrape_claims:{table}",))
+        existing = set(get_columns_postgres(conn, table))
+        for column, column_type in CLAIM_COLUMNS_POSTGRES.items():
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_scrape_queue ON {table} (id) "
+                       f"WHERE scrape_state IS NULL OR scrape_state = 'claimed'")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_scrape_owner ON {table} (scrape_owner) "
+                       f"WHERE scrape_state = 'claimed'")
+
+def claim_urls_postgres(conn, table, url_column, batch_size, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+    # SKIP LOCKED lets workers on other machines claim the next rows instead
+    # of waiting on the ones being claimed here. Leases use the server clock.
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f"""
+        WITH free AS (
+            SELECT id FROM {table}
+            WHERE (scrape_state IS NULL OR scrape_state = 'claimed')
+              AND COALESCE(scrape_lease_until, '-infinity') < now()
+            ORDER BY id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE {table} AS t
+        SET scrape_state = 'claimed', scrape_owner = %s,
+            scrape_lease_until = now() + make_interval(secs => %s)
+        FROM free WHERE t.id = free.id
+        RETURNING t.id, t.{url_column}
+        """, (batch_size, owner, lease_seconds))
+        rows = cursor.fetchall()
+    return sorted(rows)
+
+def renew_claims_postgres(conn, table, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f"UPDATE {table} SET scrape_lease_until = now() + make_interval(secs => %s) "
+                       f"WHERE scrape_state = 'claimed' AND scrape_owner = %s", (lease_seconds, owner))
+
+def ack_claims_postgres(cursor, table, ids):
+    cursor.execute(f"UPDATE {table} SET scrape_state = 'done', scrape_lease_until = NULL WHERE id = ANY(%s)",
+                   (list(ids),))
+
+def release_claims_postgres(cursor, table, ids):
+    # Give claimed rows back, e.g. when their output could not be stored.
+    cursor.execute(f"UPDATE {table} SET scrape_state = NULL, scrape_owner = NULL, scrape_lease_until = NULL "
+                   f"WHERE id = ANY(%s) AND scrape_state = 'claimed'", (list(ids),))
+
+def count_unclaimed_postgres(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE scrape_state IS NULL OR scrape_state = 'claimed'")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
 def create_output_table_postgres(conn, table_name):
     cursor = conn.cursor()
     cursor.execute(f"""
@@ -84,12 +336,157 @@ def create_output_table_postgres(conn, table_name):
         status TEXT
     )
     """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_url ON {table_name} (url)")
     conn.commit()
     cursor.close()
 
 def store_output_postgres(conn, table_name, job):
     cursor = conn.cursor()
     cursor.execute(f"INSERT INTO {table_name} (job_id, url, response, status) VALUES (%s, %s, %s, %s)",
-                   (job['id'], job['url'], job['response'].get('markdown', ''), job['status']))
+                   output_row(job))
     conn.commit()
     cursor.close()
+
+
+# --- Batched PostgreSQL Sink ---
+class PostgresSink:
+    """
+    Buffers output rows per table and writes them with execute_values over
+    a pooled connection, flush_size rows at a time or every flush_interval
+    seconds. Each output table is created once per sink rather than once
+    per row.
+
+    If a batch fails it is retried row by row. A row that still fails has
+    its claimed source row released, so it is scraped again instead of
+    staying claimed, and is reported to on_error(table_name, row).
+    """
+
+    def __init__(self, host, port, database, user, password,
+                 flush_size=500, flush_interval=1.0, minconn=1, maxconn=4, on_error=None):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.pool = ThreadedConnectionPool(minconn, maxconn, host=host, port=port, database=database,
+                                           user=user, password=password)
+        # getconn() raises instead of waiting when the pool is exhausted.
+        self._connections = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # Batches taken off the buffer but not written yet; flush() waits
+        # for them so that it returns only once everything is stored.
+        self._writing = 0
+        self._idle = threading.Condition(self._lock)
+        # (output row, ack) pairs per output table.
+        self._rows = {}
+        self._ready_tables = set()
+        self._schema_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="postgres-sink", daemon=True)
+        self._thread.start()
+
+    def store(self, table_name, job, ack=None):
+        # ack=(source_table, row_ids) marks the claimed source rows done in
+        # the same transaction as their output.
+        batch = None
+        with self._lock:
+            entries = self._rows.setdefault(table_name, [])
+            entries.append((output_row(job), ack))
+            if len(entries) >= self.flush_size:
+                batch = self._rows.pop(table_name)
+                self._writing += 1
+        if batch:
+            self._write_batches({table_name: batch})
+
+    def flush(self):
+        with self._lock:
+            pending, self._rows = self._rows, {}
+            self._writing += bool(pending)
+        if pending:
+            self._write_batches(pending)
+        with self._idle:
+            while self._writing:
+                self._idle.wait()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self.pool.closeall()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _write_batches(self, batches):
+        try:
+            for table_name, entries in batches.items():
+                self._write(table_name, entries)
+        finally:
+            with self._idle:
+                self._writing -= 1
+                self._idle.notify_all()
+
+    def _write(self, table_name, entries):
+        with self._connections:
+            conn = self.pool.getconn()
+            try:
+                try:
+                    self._insert(conn, table_name, entries)
+                    return
+                except Exception as ex:
+                    # Retry one by one so a single bad row does not drop the batch.
+                    logger.error(f"Batch of {len(entries)} rows to {table_name} failed ({ex}); retrying individually")
+                for entry in entries:
+                    conn = self._reconnect(conn)
+                    try:
+                        self._insert(conn, table_name, [entry])
+                    except Exception as ex:
+                        logger.error(f"Error writing {entry[0][1]} to {table_name}: {ex}")
+                        conn = self._reconnect(conn)
+                        self._release(conn, entry[1])
+                        if self.on_error:
+                            self.on_error(table_name, entry[0])
+            finally:
+                if conn is not None:
+                    self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _reconnect(self, conn):
+        # A dropped connection is swapped for a fresh one, so retries and
+        # claim releases do not fail just because the last attempt broke it.
+        # If none can be had, the database is unreachable and the heartbeat
+        # cannot renew the leases either, so the claims lapse on their own.
+        if conn is not None and not conn.closed:
+            return conn
+        if conn is not None:
+            self.pool.putconn(conn, close=True)
+        try:
+            return self.pool.getconn()
+        except Exception as ex:
+            logger.error(f"Error reconnecting to PostgreSQL: {ex}")
+            return None
+
+    def _insert(self, conn, table_name, entries):
+        if table_name not in self._ready_tables:
+            # Concurrent CREATE TABLE IF NOT EXISTS can still collide.
+            with self._schema_lock:
+                if table_name not in self._ready_tables:
+                    create_output_table_postgres(conn, table_name)
+                    self._ready_tables.add(table_name)
+        acks = {}
+        for _, ack in entries:
+            if ack is not None:
+                acks.setdefault(ack[0], []).extend(ack[1])
+        with conn, conn.cursor() as cursor:
+            execute_values(cursor,
+                           f"INSERT INTO {table_name} (job_id, url, response, status) VALUES %s",
+                           [row for row, _ in entries], page_size=len(entries))
+            for source_table, ids in acks.items():
+                ack_claims_postgres(cursor, source_table, ids)
+
+    def _release(self, conn, ack):
+        if ack is None or conn is None:
+            return
+        try:
+            with conn, conn.cursor() as cursor:
+                release_claims_postgres(cursor, ack[0], ack[1])
+        except Exception as ex:
+            logger.error(f"Error releasing claims on {ack[0]} rows {ack[1]}: {ex}")
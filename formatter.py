@@ -1,23 +1,70 @@
 # file_path/formatter.py
 import pandas as pd
+import gzip
 import os
 
+# Rows of a CSV file read at a time; only the URL column is kept.
+CSV_CHUNK_ROWS = 50000
+
+def _open_text(file_path, compressed):
+    if compressed:
+        return gzip.open(file_path, "rt", encoding="utf-8")
+    return open(file_path, "r", encoding="utf-8")
+
+def iter_urls(file_path, column=0):
+    # Yields the URLs of a .txt, .csv or .xlsx file (optionally gzipped,
+    # e.g. urls.csv.gz) as they are read, so jobs can start long before a
+    # large file has been read to the end. column is the position or header
+    # name of the URL column in CSV and Excel files; their first row is the
+    # header. Errors are raised to the caller.
+    name = file_path[:-3] if file_path.lower().endswith(".gz") else file_path
+    compressed = name != file_path
+    ext = os.path.splitext(name)[1].lower()
+    if ext == ".txt":
+        with _open_text(file_path, compressed) as f:
+            for line in f:
+                url = line.strip()
+                if url:
+                    yield url
+    elif ext == ".csv":
+        # pandas infers gzip from the file name.
+        with pd.read_csv(file_path, usecols=[column], dtype=str, chunksize=CSV_CHUNK_ROWS) as chunks:
+            for chunk in chunks:
+                for url in chunk.iloc[:, 0].dropna():
+                    url = url.strip()
+                    if url:
+                        yield url
+    elif ext == ".xlsx":
+        yield from _iter_xlsx(gzip.open(file_path, "rb") if compressed else file_path, column)
+    elif ext == ".xls":
+        # The legacy format has no streaming reader; only the URL column is kept.
+        df = pd.read_excel(file_path, usecols=[column], dtype=str)
+        for url in df.iloc[:, 0].dropna():
+            if url.strip():
+                yield url.strip()
+
+def _iter_xlsx(source, column):
+    from openpyxl import load_workbook
+
+    # Read-only mode streams rows from the archive instead of building the sheet.
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, ())
+        index = list(header).index(column) if isinstance(column, str) else column
+        for row in rows:
+            if index < len(row) and row[index] is not None:
+                url = str(row[index]).strip()
+                if url:
+                    yield url
+    finally:
+        workbook.close()
+
 def parse_file(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
     urls = []
     try:
-        if ext == ".csv":
-            df = pd.read_csv(file_path)
-        elif ext in [".xls", ".xlsx"]:
-            df = pd.read_excel(file_path)
-        elif ext == ".txt":
-            with open(file_path, "r", encoding="utf-8") as f:
-                urls = [line.strip() for line in f if line.strip()]
-            return urls
-        else:
-            return []
-        # Assumes URLs are in the first column
-        urls = df.iloc[:, 0].dropna().astype(str).tolist()
+        for url in iter_urls(file_path):
+            urls.append(url)
     except Exception as e:
         print(f"Error parsing file: {e}")
     return urls
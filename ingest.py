@@ -0,0 +1,343 @@
+# file_path/ingest.py
+
+import time
+import select
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import db_config
+
+logger = logging.getLogger(__name__)
+
+# Idle SQLite sources check PRAGMA data_version starting this often, backing
+# off to SQLITE_MAX_CHECK seconds while nothing changes.
+SQLITE_MIN_CHECK = 0.005
+SQLITE_MAX_CHECK = 0.1
+NOTIFY_CHANNEL = "scraper_new_urls"
+
+
+class _LeasedSource:
+    """
+    Base for URL tables consumed through leased claims.
+
+    Rows are claimed in batches under this process's worker id, so any
+    number of processes (on any number of machines) can consume the same
+    table without getting the same row. A heartbeat thread renews the
+    leases of claimed rows until they are acknowledged as done together
+    with their stored output; rows claimed by a worker that died are
+    claimed again once their lease runs out.
+    """
+
+    def __init__(self, table: str, column: str, lease_seconds: float):
+        self.table = table
+        self.column = column
+        self.lease_seconds = lease_seconds
+        self.owner = db_config.worker_id()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name="ingest-heartbeat", daemon=True)
+
+    def fetch(self, batch_size: int) -> List[Tuple[int, str]]:
+        """
+        Claim the next free rows.
+
+        Args:
+            batch_size (int): Maximum rows to claim.
+
+        Returns:
+            list: ``(id, url)`` rows, now leased to this worker.
+        """
+        with self._lock:
+            return self._claim(batch_size)
+
+    def ack(self, ids: List[int]) -> None:
+        """
+        Mark claimed rows done outside of an output transaction, for callers
+        that store output elsewhere and ack once it is durable.
+
+        Args:
+            ids (list): Row ids claimed through ``fetch``.
+        """
+        if ids:
+            with self._lock:
+                self._ack(ids)
+
+    def remaining(self) -> int:
+        """
+        Returns:
+            int: Rows not done yet, including rows leased to other workers.
+        """
+        with self._lock:
+            return self._count()
+
+    def _renew_loop(self) -> None:
+        while not self._closed.wait(self.lease_seconds / 3):
+            try:
+                with self._lock:
+                    self._renew()
+            except Exception as ex:
+                logger.error(f"Error renewing leases on {self.table}: {ex}")
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            self._conn.close()
+
+
+class SQLiteSource(_LeasedSource):
+    """
+    A table of URLs in a SQLite file, consumed through leased claims.
+
+    Changes are detected with ``PRAGMA data_version``, which moves whenever
+    another connection commits to the file and costs no table read.
+    """
+
+    def __init__(self, path: str, table: str, column: str, lease_seconds: float = db_config.DEFAULT_LEASE_SECONDS):
+        """
+        Args:
+            path (str): SQLite file.
+            table (str): Table holding the URLs; must have an integer ``id``.
+                Claim columns are added to it if missing.
+            column (str): Column holding the URLs.
+            lease_seconds (float): How long claimed rows stay reserved
+                without a heartbeat.
+        """
+        super().__init__(table, column, lease_seconds)
+        self._conn = db_config.connect_sqlite(path)
+        db_config.ensure_claim_columns_sqlite(self._conn, table)
+        # data_version as of the last claim; a commit after it, even one
+        # that lands while the claim runs, wakes wait_for_change.
+        self._version = self._data_version()
+        self._heartbeat.start()
+
+    def _data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version;").fetchone()[0]
+
+    def _claim(self, batch_size: int) -> List[Tuple[int, str]]:
+        self._version = self._data_version()
+        return db_config.claim_urls_sqlite(
+            self._conn, self.table, self.column, batch_size, self.owner, self.lease_seconds
+        )
+
+    def _renew(self) -> None:
+        db_config.renew_claims_sqlite(self._conn, self.table, self.owner, self.lease_seconds)
+
+    def _ack(self, ids: List[int]) -> None:
+        with self._conn:
+            db_config.ack_claims_sqlite(self._conn, self.table, ids)
+
+    def _count(self) -> int:
+        return db_config.count_unclaimed_sqlite(self._conn, self.table)
+
+    def wait_for_change(self, timeout: float, stopped: threading.Event) -> bool:
+        """
+        Block until the file changes, ``timeout`` passes or ``stopped`` is set.
+        Changes are counted from just before the last ``fetch``, so a row
+        committed while that fetch ran is not missed.
+
+        Returns:
+            bool: True if the file changed.
+        """
+        with self._lock:
+            version = self._version
+        deadline = time.monotonic() + timeout
+        delay = SQLITE_MIN_CHECK
+        while not stopped.wait(min(delay, max(0.0, deadline - time.monotonic()))):
+            with self._lock:
+                if self._data_version() != version:
+                    return True
+            if time.monotonic() >= deadline:
+                return False
+            delay = min(delay * 2, SQLITE_MAX_CHECK)
+        return False
+
+
+
+class PostgresSource(_LeasedSource):
+    """
+    A table of URLs in PostgreSQL, consumed through leased claims.
+
+    A statement-level trigger on the table sends a NOTIFY on every insert,
+    and the source LISTENs for it, so an idle watcher sleeps on the socket
+    without querying. If the trigger cannot be installed (e.g. missing
+    privileges) the watcher falls back to fetching every ``max_idle``
+    seconds.
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        database,
+        user,
+        password,
+        table: str,
+        column: str,
+        lease_seconds: float = db_config.DEFAULT_LEASE_SECONDS,
+    ):
+        """
+        Args:
+            host, port, database, user, password: Connection settings.
+            table (str): Table holding the URLs; must have an integer ``id``.
+                Claim columns are added to it if missing.
+            column (str): Column holding the URLs.
+            lease_seconds (float): How long claimed rows stay reserved
+                without a heartbeat.
+        """
+        super().__init__(table, column, lease_seconds)
+        self._conn = db_config.connect_postgres(host, port, database, user, password)
+        db_config.ensure_claim_columns_postgres(self._conn, table)
+        self.notifying = self._install_trigger()
+        self._conn.autocommit = True
+        if self.notifying:
+            with self._conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+        self._heartbeat.start()
+
+    def _install_trigger(self) -> bool:
+        function = f"{self.table}_scraper_notify"
+        try:
+            with self._conn, self._conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (function,))
+                cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION "{function}"() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('{NOTIFY_CHANNEL}', TG_TABLE_NAME);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                """)
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{function}" ON "{self.table}";')
+                cursor.execute(
+                    f'CREATE TRIGGER "{function}" AFTER INSERT ON "{self.table}" '
+                    f'FOR EACH STATEMENT EXECUTE PROCEDURE "{function}"();'
+                )
+            return True
+        except Exception as ex:
+            logger.warning(f"Could not install notify trigger on {self.table} ({ex}); falling back to polling")
+            return False
+
+    def _claim(self, batch_size: int) -> List[Tuple[int, str]]:
+        return db_config.claim_urls_postgres(
+            self._conn, self.table, self.column, batch_size, self.owner, self.lease_seconds
+        )
+
+    def _renew(self) -> None:
+        db_config.renew_claims_postgres(self._conn, self.table, self.owner, self.lease_seconds)
+
+    def _ack(self, ids: List[int]) -> None:
+        with self._conn.cursor() as cursor:
+            db_config.ack_claims_postgres(cursor, self.table, ids)
+
+    def _count(self) -> int:
+        return db_config.count_unclaimed_postgres(self._conn, self.table)
+
+    def wait_for_change(self, timeout: float, stopped: threading.Event) -> bool:
+        """
+        Block until an insert is notified, ``timeout`` passes or ``stopped``
+        is set. ``stop()`` wakes the wait through ``stopped`` within a second.
+
+        Returns:
+            bool: True if an insert into the table was notified.
+        """
+        if not self.notifying:
+            stopped.wait(timeout)
+            return False
+        deadline = time.monotonic() + timeout
+        while not stopped.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            select.select([self._conn], [], [], min(remaining, 1.0))
+            with self._lock:
+                self._conn.poll()
+                notified = any(n.payload == self.table for n in self._conn.notifies)
+                self._conn.notifies.clear()
+            if notified:
+                return True
+        return False
+
+
+class Watcher:
+    """
+    Background thread that feeds new rows of a source to a callback.
+
+    While rows keep arriving the source is drained ``batch_size`` rows at a
+    time. When it runs dry the watcher sleeps until the source reports a
+    change (or ``max_idle`` seconds pass, as a safety net) instead of
+    re-querying on a fixed interval.
+    """
+
+    def __init__(self, source: Any, on_rows: Callable[[List[Tuple[int, str]]], None], batch_size: int = 100, max_idle: float = 5.0):
+        """
+        Args:
+            source: A ``SQLiteSource`` or ``PostgresSource``.
+            on_rows (callable): Receives each non-empty batch of ``(id, url)`` rows.
+            batch_size (int): Rows fetched at a time.
+            max_idle (float): Longest wait between fetches while idle.
+        """
+        self.source = source
+        self.on_rows = on_rows
+        self.batch_size = batch_size
+        self.max_idle = max_idle
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ingest-watcher", daemon=True)
+
+    def start(self) -> "Watcher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive() and not self._stopped.is_set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                rows = self.source.fetch(self.batch_size)
+                if rows:
+                    self.on_rows(rows)
+                    continue
+                self.source.wait_for_change(self.max_idle, self._stopped)
+            except Exception as ex:
+                logger.error(f"Error watching {self.source.table}: {ex}")
+                self._stopped.wait(self.max_idle)
+
+
+class WatcherSet:
+    """At most one running watcher per source key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watchers: Dict[Hashable, Watcher] = {}
+
+    def start(self, key: Hashable, factory: Callable[[], Watcher]) -> Optional[Watcher]:
+        """
+        Start a watcher for ``key`` unless one is already running.
+
+        Args:
+            key: Identifies the source, e.g. ``("sqlite", path, table, column)``.
+            factory (callable): Creates the (unstarted) watcher.
+
+        Returns:
+            Watcher: The new watcher, or None if one was already running.
+        """
+        with self._lock:
+            current = self._watchers.get(key)
+            if current is not None and current.running:
+                return None
+            watcher = self._watchers[key] = factory()
+        return watcher.start()
+
+    def stop_all(self) -> None:
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+        for watcher in watchers:
+            watcher.stop()
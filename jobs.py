@@ -0,0 +1,539 @@
+# file_path/jobs.py
+
+import json
+import time
+import sqlite3
+import itertools
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import db_config
+from main2 import compress_text, decompress_text
+from scraper import DEFAULT_FRESHNESS_TTL, canonicalize_url
+
+JOBS_DB_FILE = "jobs.db"
+RESULTS_DB_FILE = "job_results.db"
+# Full results kept in memory, by approximate size in characters.
+RESULT_CACHE_SIZE = 64 * 1024 * 1024
+STATUSES = ("in queue", "in progress", "completed", "error")
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+_UNFINISHED = (_STATUS_CODES["in queue"], _STATUS_CODES["in progress"])
+
+
+class Job:
+    """A read-only snapshot of one registered job."""
+
+    __slots__ = ("id", "url", "status", "submitted", "source", "source_row")
+
+    def __init__(
+        self,
+        job_id: int,
+        url: str,
+        status: str,
+        submitted: float,
+        source: Optional[Dict[str, Any]],
+        source_row: Optional[int] = None,
+    ):
+        self.id = job_id
+        self.url = url
+        self.status = status
+        self.submitted = submitted
+        self.source = source
+        # Id of the claimed row in the source table, acknowledged when the
+        # job's output is stored.
+        self.source_row = source_row
+
+    @property
+    def timestamp(self) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.submitted))
+
+
+class JobRegistry:
+    """
+    Thread-safe store of every job submitted to the app.
+
+    Jobs are kept column-wise (a list of URLs plus compact arrays of status
+    codes, submit times and source references) instead of one dict per job,
+    so a million queued jobs take little more memory than their URLs. Ids
+    are allocated under the registry lock and never reused, also across
+    ``clear()``. Jobs can be looked up by canonical URL and counted by
+    status, and the ids changed since the last ``drain_changes()`` are tracked for
+    the UI. With a ``path``, every change is also written to a SQLite file
+    through a batching writer, and the jobs are loaded back on start-up.
+    """
+
+    def __init__(self, path: Optional[str] = JOBS_DB_FILE):
+        """
+        Args:
+            path (str, optional): SQLite file to persist jobs in; None keeps
+                them in memory only.
+        """
+        self._lock = threading.Lock()
+        # Position of a job in the columns is its id minus _base, the id of
+        # the first job held.
+        self._base = 1
+        self._urls: List[str] = []
+        self._status = bytearray()
+        self._submitted = array("d")
+        self._source_refs = array("I")
+        self._source_rows = array("q")
+        # Distinct job sources (e.g. a DB config), 0 meaning none.
+        self._sources: List[Optional[Dict[str, Any]]] = [None]
+        self._source_index: Dict[str, int] = {}
+        # Latest job per canonical URL, per source. Duplicates are only looked
+        # up within a source, so a source row is never skipped in favour of a
+        # job that stored its output somewhere else.
+        self._by_url: Dict[int, Dict[str, int]] = {}
+        self._counts = [0] * len(STATUSES)
+        self._changed: Set[int] = set()
+        self._writer = None
+        next_id = 1
+        if path:
+            conn = db_config.connect_sqlite(path, wal=True)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                submitted REAL NOT NULL,
+                source TEXT,
+                source_row INTEGER,
+                canonical_url TEXT
+            );
+            """)
+            # canonical_url is NULL when it equals url, which is the usual case.
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs);")}
+            for column, column_type in (("source_row", "INTEGER"), ("canonical_url", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type};")
+            conn.commit()
+            next_id = self._load(conn)
+            conn.close()
+            self._writer = db_config.SQLiteWriter(path, wal=True)
+        self._ids = itertools.count(next_id)
+
+    def _load(self, conn: sqlite3.Connection) -> int:
+        # Jobs that were running when the app stopped are queued again.
+        conn.execute("UPDATE jobs SET status = ? WHERE status = ?;", (_UNFINISHED[0], _UNFINISHED[1]))
+        conn.commit()
+        # sqlite_sequence remembers the highest id ever used, so ids are not
+        # reused after a clear().
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'jobs';").fetchone()
+        next_id = (row[0] if row else 0) + 1
+        for job_id, url, status, submitted, source, source_row, canonical in conn.execute(
+            "SELECT id, url, status, submitted, source, source_row, canonical_url FROM jobs ORDER BY id;"
+        ):
+            source_ref = self._source_ref(json.loads(source) if source else None)
+            self._append(job_id, url, canonical or url, status, submitted, source_ref, source_row)
+        return next_id
+
+    def _append(
+        self,
+        job_id: int,
+        url: str,
+        canonical: str,
+        status: int,
+        submitted: float,
+        source_ref: int,
+        source_row: Optional[int],
+    ) -> None:
+        if not self._urls:
+            self._base = job_id
+        # Keep positions aligned with ids if a stored row is missing.
+        while self._base + len(self._urls) < job_id:
+            self._urls.append("")
+            self._status.append(_STATUS_CODES["error"])
+            self._submitted.append(0.0)
+            self._source_refs.append(0)
+            self._source_rows.append(-1)
+        self._urls.append(url)
+        self._status.append(status)
+        self._submitted.append(submitted)
+        self._source_refs.append(source_ref)
+        self._source_rows.append(-1 if source_row is None else source_row)
+        self._by_url.setdefault(source_ref, {})[canonical] = job_id
+        self._counts[status] += 1
+
+    def _source_ref(self, source: Optional[Dict[str, Any]]) -> int:
+        if not source:
+            return 0
+        key = json.dumps(source, sort_keys=True)
+        ref = self._source_index.get(key)
+        if ref is None:
+            ref = self._source_index[key] = len(self._sources)
+            self._sources.append(source)
+        return ref
+
+    def _position(self, job_id: int) -> Optional[int]:
+        position = job_id - self._base
+        if 0 <= position < len(self._urls) and self._urls[position]:
+            return position
+        return None
+
+    def _snapshot(self, position: int) -> Job:
+        return Job(
+            self._base + position,
+            self._urls[position],
+            STATUSES[self._status[position]],
+            self._submitted[position],
+            self._sources[self._source_refs[position]],
+            self._source_rows[position] if self._source_rows[position] != -1 else None,
+        )
+
+    def add(self, url: str, source: Optional[Dict[str, Any]] = None, source_row: Optional[int] = None) -> int:
+        """
+        Register a new queued job.
+
+        Args:
+            url (str): The URL to scrape.
+            source (dict, optional): Where the job came from, e.g. a DB config.
+            source_row (int, optional): The claimed source row the URL came from.
+
+        Returns:
+            int: The new job's id.
+        """
+        return self.add_many([url], source, None if source_row is None else [source_row])[0]
+
+    def add_many(
+        self,
+        urls: Iterable[str],
+        source: Optional[Dict[str, Any]] = None,
+        source_rows: Optional[Iterable[int]] = None,
+    ) -> List[int]:
+        """
+        Register several queued jobs under one lock acquisition.
+
+        Args:
+            urls (Iterable[str]): The URLs to scrape.
+            source (dict, optional): Where the jobs came from.
+            source_rows (Iterable[int], optional): The claimed source row of
+                each URL.
+
+        Returns:
+            List[int]: The new jobs' ids, in order.
+        """
+        submitted = time.time()
+        source_json = json.dumps(source) if source else None
+        ids = []
+        with self._lock:
+            ref = self._source_ref(source)
+            rows = iter(source_rows) if source_rows is not None else itertools.repeat(None)
+            for url, source_row in zip(urls, rows):
+                ids.append(self._add(url, canonicalize_url(url), submitted, ref, source_json, source_row))
+        return ids
+
+    def add_if_new(
+        self,
+        url: str,
+        source: Optional[Dict[str, Any]] = None,
+        source_row: Optional[int] = None,
+        max_age: float = DEFAULT_FRESHNESS_TTL,
+    ) -> Optional[int]:
+        """
+        Register a queued job unless a job from the same source for the
+        same canonical URL is already queued or running, or completed less
+        than ``max_age`` seconds ago. Failed jobs do not count, so their URLs
+        can be retried.
+
+        Args:
+            url (str): The URL to scrape.
+            source (dict, optional): Where the job came from.
+            source_row (int, optional): The claimed source row the URL came from.
+            max_age (float): How long a completed job keeps its URL fresh.
+
+        Returns:
+            int: The new job's id, or None if the URL is a duplicate.
+        """
+        canonical = canonicalize_url(url)
+        submitted = time.time()
+        with self._lock:
+            ref = self._source_ref(source)
+            job_id = self._by_url.get(ref, {}).get(canonical)
+            position = None if job_id is None else self._position(job_id)
+            if position is not None:
+                status = self._status[position]
+                if status in _UNFINISHED:
+                    return None
+                if status == _STATUS_CODES["completed"] and submitted - self._submitted[position] < max_age:
+                    return None
+            source_json = json.dumps(source) if source else None
+            return self._add(url, canonical, submitted, ref, source_json, source_row)
+
+    def _add(
+        self,
+        url: str,
+        canonical: str,
+        submitted: float,
+        source_ref: int,
+        source_json: Optional[str],
+        source_row: Optional[int],
+    ) -> int:
+        status = _STATUS_CODES["in queue"]
+        job_id = next(self._ids)
+        self._append(job_id, url, canonical, status, submitted, source_ref, source_row)
+        self._changed.add(job_id)
+        if self._writer:
+            self._writer.execute(
+                "INSERT INTO jobs (id, url, status, submitted, source, source_row, canonical_url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                (job_id, url, status, submitted, source_json, source_row, None if canonical is url else canonical),
+            )
+        return job_id
+
+    def set_status(self, job_id: int, status: str) -> bool:
+        """
+        Move a job to a new status.
+
+        Args:
+            job_id (int): The job to update.
+            status (str): One of ``STATUSES``.
+
+        Returns:
+            bool: False if the job is unknown (e.g. it was cleared).
+        """
+        code = _STATUS_CODES[status]
+        with self._lock:
+            position = self._position(job_id)
+            if position is None:
+                return False
+            self._counts[self._status[position]] -= 1
+            self._counts[code] += 1
+            self._status[position] = code
+            self._changed.add(job_id)
+            if self._writer:
+                self._writer.execute("UPDATE jobs SET status = ? WHERE id = ?;", (code, job_id))
+        return True
+
+    def get(self, job_id: int) -> Optional[Job]:
+        """
+        Args:
+            job_id (int): The job to look up.
+
+        Returns:
+            Job: A snapshot of the job, or None if it is unknown.
+        """
+        with self._lock:
+            position = self._position(job_id)
+            return None if position is None else self._snapshot(position)
+
+    def find_url(self, url: str, source: Optional[Dict[str, Any]] = None) -> Optional[Job]:
+        """
+        Args:
+            url (str): A submitted URL, in any of its non-canonical forms.
+            source (dict, optional): The source the job came from.
+
+        Returns:
+            Job: The most recent job for the URL from that source, or None.
+        """
+        canonical = canonicalize_url(url)
+        with self._lock:
+            job_id = self._by_url.get(self._source_ref(source), {}).get(canonical)
+            position = None if job_id is None else self._position(job_id)
+            return None if position is None else self._snapshot(position)
+
+    def page(self, offset: int, limit: int) -> List[Job]:
+        """
+        Args:
+            offset (int): Number of jobs to skip, oldest first.
+            limit (int): Maximum number of jobs to return.
+
+        Returns:
+            List[Job]: Snapshots of the jobs in submission order.
+        """
+        with self._lock:
+            end = min(max(offset, 0) + limit, len(self._urls))
+            return [self._snapshot(p) for p in range(max(offset, 0), end) if self._urls[p]]
+
+    def unfinished(self) -> List[Job]:
+        """
+        Returns:
+            List[Job]: Queued jobs, e.g. those left over from a previous run.
+        """
+        positions = []
+        with self._lock:
+            # bytearray.find skips finished jobs at C speed, without an index
+            # costing memory per job.
+            for code in _UNFINISHED:
+                position = self._status.find(code)
+                while position != -1:
+                    if self._urls[position]:
+                        positions.append(position)
+                    position = self._status.find(code, position + 1)
+            return [self._snapshot(p) for p in sorted(positions)]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns:
+            dict: Number of jobs per status.
+        """
+        with self._lock:
+            return dict(zip(STATUSES, self._counts))
+
+    def drain_changes(self) -> Set[int]:
+        """
+        Returns:
+            set: Ids of jobs added or updated since the last call.
+        """
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return changed
+
+    def clear(self) -> None:
+        """Forget every job; updates for jobs still running are ignored."""
+        with self._lock:
+            self._urls = []
+            self._status = bytearray()
+            self._submitted = array("d")
+            self._source_refs = array("I")
+            self._source_rows = array("q")
+            self._by_url.clear()
+            self._counts = [0] * len(STATUSES)
+            self._changed.clear()
+            if self._writer:
+                self._writer.execute("DELETE FROM jobs;")
+
+    def close(self) -> None:
+        """Write pending changes and close the jobs file."""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._urls)
+
+
+class ResultSummary:
+    """The part of a finished job's result kept in memory for every job."""
+
+    __slots__ = ("title", "status_code", "markdown_size", "html_size", "error")
+
+    def __init__(self, result: Dict[str, Any]):
+        metadata = result.get("metadata") or {}
+        self.title = metadata.get("title") or ""
+        self.status_code = metadata.get("statusCode")
+        self.markdown_size = len(result.get("markdown") or "")
+        self.html_size = len(metadata.get("html") or "")
+        self.error = result.get("error")
+
+
+def _result_size(result: Dict[str, Any]) -> int:
+    # Markdown and raw HTML dominate; the rest is roughly constant.
+    return len(result.get("markdown") or "") + len((result.get("metadata") or {}).get("html") or "") + 4096
+
+
+class ResultStore:
+    """
+    Results of finished jobs, bounded in memory.
+
+    Every result is written, compressed, to a SQLite file as soon as it is
+    stored. Only a ``ResultSummary`` stays in memory for each job, plus the
+    full results most recently stored or viewed, up to ``max_size``
+    characters. Results evicted from memory are read back from the file on
+    demand.
+    """
+
+    def __init__(self, path: str = RESULTS_DB_FILE, max_size: int = RESULT_CACHE_SIZE):
+        """
+        Args:
+            path (str): SQLite file the full results are written to.
+            max_size (int): Approximate characters of full results kept in memory.
+        """
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[int, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._size = 0
+        self._summaries: Dict[int, ResultSummary] = {}
+        conn = db_config.connect_sqlite(path, wal=True)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_results (
+            job_id INTEGER PRIMARY KEY,
+            codec TEXT,
+            data BLOB
+        );
+        """)
+        conn.commit()
+        conn.close()
+        self._writer = db_config.SQLiteWriter(path, wal=True)
+        # Reads use their own connection; the writer's belongs to its thread.
+        self._reader = db_config.connect_sqlite(path, wal=True)
+        self._reader_lock = threading.Lock()
+
+    def put(self, job_id: int, result: Dict[str, Any]) -> None:
+        """
+        Store a finished job's result.
+
+        Args:
+            job_id (int): The job the result belongs to.
+            result (dict): The ``run_job`` result.
+        """
+        codec, data = compress_text(json.dumps(result))
+        self._writer.execute(
+            "INSERT OR REPLACE INTO job_results (job_id, codec, data) VALUES (?, ?, ?);", (job_id, codec, data)
+        )
+        with self._lock:
+            self._summaries[job_id] = ResultSummary(result)
+            self._remember(job_id, result)
+
+    def summary(self, job_id: int) -> Optional[ResultSummary]:
+        """
+        Args:
+            job_id (int): A finished job.
+
+        Returns:
+            ResultSummary: The job's summary, or None if it has no result.
+        """
+        with self._lock:
+            return self._summaries.get(job_id)
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Return a job's full result, reading it back from disk if needed.
+
+        Args:
+            job_id (int): A finished job.
+
+        Returns:
+            dict: The ``run_job`` result, or None if there is none.
+        """
+        with self._lock:
+            entry = self._recent.get(job_id)
+            if entry is not None:
+                self._recent.move_to_end(job_id)
+                return entry[0]
+        # Make sure the result has reached the file before reading it.
+        self._writer.flush()
+        with self._reader_lock:
+            row = self._reader.execute("SELECT codec, data FROM job_results WHERE job_id = ?;", (job_id,)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(decompress_text(row[0], row[1]))
+        with self._lock:
+            self._remember(job_id, result)
+        return result
+
+    def _remember(self, job_id: int, result: Dict[str, Any]) -> None:
+        previous = self._recent.pop(job_id, None)
+        if previous is not None:
+            self._size -= previous[1]
+        size = _result_size(result)
+        self._recent[job_id] = (result, size)
+        self._size += size
+        while self._size > self.max_size and len(self._recent) > 1:
+            _, (_, evicted) = self._recent.popitem(last=False)
+            self._size -= evicted
+
+    def clear(self) -> None:
+        """Forget every stored result."""
+        with self._lock:
+            self._recent.clear()
+            self._size = 0
+            self._summaries.clear()
+            self._writer.execute("DELETE FROM job_results;")
+
+    def close(self) -> None:
+        """Write pending results and close the file."""
+        self._writer.close()
+        self._reader.close()
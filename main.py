@@ -1,12 +1,32 @@
 import flet as ft
 import threading
 import json
-import time
 import asyncio
-from scraper import run_job
-from formatter import parse_file
+import os
+from collections import OrderedDict
+from scraper import DEFAULT_FRESHNESS_TTL, DEFAULT_HOST_BURST, DEFAULT_HOST_MAX_IN_FLIGHT, DEFAULT_HOST_RATE, JobRunner
+from formatter import iter_urls
+from jobs import JobRegistry, ResultStore
+from ingest import PostgresSource, SQLiteSource, Watcher, WatcherSet
 import db_config
 
+# Job cards materialized at a time in the jobs tab.
+JOBS_PAGE_SIZE = 100
+# Characters of markdown/JSON shown per "load more" step in the job detail,
+# and formatted job details kept for quick re-display.
+DETAIL_PAGE_CHARS = 20000
+DETAIL_CACHE_SIZE = 8
+
+
+def _page_end(text, start, size=DETAIL_PAGE_CHARS):
+    # End the page on a line break in its second half, so markdown blocks
+    # are not cut mid-line.
+    end = start + size
+    if end >= len(text):
+        return len(text)
+    cut = text.rfind("\n", start + size // 2, end)
+    return cut + 1 if cut != -1 else end
+
 
 class ScraperApp:
     def __init__(self, page: ft.Page):
@@ -25,11 +45,45 @@ class ScraperApp:
         # Set initial theme to dark.
         self.page.theme = self.dark_theme
 
-        self.jobs = []
+        # Jobs are updated from worker threads and persisted across restarts;
+        # the UI applies the registry's changed job ids once per tick
+        # instead of rebuilding the list.
+        self.jobs = JobRegistry()
+        # Full results are spilled to disk; only recent ones stay in memory.
+        self.job_results = ResultStore()
+        self.job_cards = {}
+        # Page changes and clears run on the handler thread and the periodic
+        # refresh on the event loop; the lock keeps one from rendering over
+        # the other's half-built page.
+        self.job_list_lock = threading.Lock()
+        # The job shown in the detail pane, and recently formatted details.
+        self.detail_job_id = None
+        self.detail_cache = OrderedDict()
+        self.detail_lock = threading.Lock()
+        self.job_page = 0
+        self.rendered_range = (0, 0)
+        # One bounded pool scrapes every job, whatever its source.
+        self.runner = JobRunner()
         self.sqlite_conn = None
-        self.sqlite_last_id = 0
+        # All output rows go through one batching writer thread.
+        self.sqlite_writer = None
+        self.sqlite_database = None
+        self.sqlite_output_tables = set()
         self.pg_conn = None
-        self.pg_last_id = 0
+        self.pg_sink = None
+        self.pg_database = None
+        # Jobs whose output goes to a database that is not connected (e.g.
+        # resumed at startup); they are queued once it is.
+        self.held_jobs = []
+        self.held_lock = threading.Lock()
+        # Source rows that duplicate a running job's URL, by job id; they are
+        # acknowledged together with that job's output.
+        self.duplicate_rows = {}
+        self.duplicate_lock = threading.Lock()
+        # URL sources by (type, location, table, column); each keeps its own
+        # read position and has at most one watcher.
+        self.sources = {}
+        self.watchers = WatcherSet()
 
         # Build UI components.
         self._create_scrape_tab()
@@ -44,7 +98,7 @@ class ScraperApp:
                     text="Jobs List",
                     icon=ft.Icons.LIST,
                     content=ft.Row(
-                        [self.job_list, ft.VerticalDivider(), self.job_detail],
+                        [self.job_list_panel, ft.VerticalDivider(), self.job_detail],
                         expand=True,
                     ),
                 ),
@@ -55,6 +109,11 @@ class ScraperApp:
         )
         self.page.add(self.tabs)
 
+        # Jobs left unfinished by the previous session are queued again.
+        unfinished = self.jobs.unfinished()
+        if unfinished:
+            threading.Thread(target=self._resume_jobs, args=(unfinished,), daemon=True).start()
+
     def get_scrape_bg(self):
         """Return a background color for the Scrape tab container based on theme."""
         if self.page.theme_mode == ft.ThemeMode.DARK:
@@ -97,60 +156,192 @@ class ScraperApp:
     def _on_add_job(self, e):
         url = self.url_field.value.strip()
         if url:
-            new_job = self._add_job(url)
-            threading.Thread(target=self._run_scraper, args=(new_job,), daemon=True).start()
-            self.url_field.value = ""
-            self._show_snack("Job added successfully!")
+            # Added by hand, so scraped again however recently it was.
+            job_id = self._add_job(url, max_age=0)
+            if job_id is None:
+                self._show_snack("This URL is already queued.")
+            else:
+                self._run_scraper(job_id, url)
+                self.url_field.value = ""
+                self._show_snack("Job added successfully!")
         else:
             self._show_snack("Please enter a valid URL.")
         self.page.update()
 
     def _on_file_upload_result(self, e: ft.FilePickerResultEvent):
         if e.files:
-            urls = parse_file(e.files[0].path)
-            for url in urls:
-                new_job = self._add_job(url)
-                threading.Thread(target=self._run_scraper, args=(new_job,), daemon=True).start()
-            self._show_snack(f"{len(urls)} jobs added from file.")
+            # The file is read while its first jobs already run; queueing
+            # blocks once the runner's backlog is full, so feed the jobs from
+            # a single background thread instead of the UI handler.
+            threading.Thread(target=self._queue_file, args=(e.files[0].path,), daemon=True).start()
+            self._show_snack("Adding jobs from file...")
         self.page.update()
 
-    def _add_job(self, url, db_config_info=None):
-        job = {
-            "id": len(self.jobs) + 1,
-            "url": url,
-            "status": "in queue",
-            "response": {},
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        }
-        if db_config_info:
-            job["db_config"] = db_config_info
-        self.jobs.append(job)
-        return job
-
-    def _run_scraper(self, job):
-        job["status"] = "in progress"
-        result = run_job(job["url"])
-        job["response"] = result
-        job["status"] = (
-            "completed" if result.get("metadata", {}).get("statusCode") == 200 else "error"
+    def _queue_file(self, path):
+        count = duplicates = 0
+        try:
+            for url in iter_urls(path):
+                job_id = self._add_job(url)
+                if job_id is None:
+                    duplicates += 1
+                    continue
+                self._run_scraper(job_id, url)
+                count += 1
+        except Exception as ex:
+            self._show_snack(f"Error reading file after {count} URLs: {ex}")
+            return
+        self._show_snack(f"{count} jobs added from file, {duplicates} duplicate URLs skipped.")
+
+    def _add_job(self, url, db_config_info=None, source_row=None, max_age=None):
+        # None when the URL is already queued or was scraped less than
+        # max_age seconds ago (by default the Settings value) for the same
+        # source.
+        if max_age is None:
+            max_age = self._freshness_ttl()
+        return self.jobs.add_if_new(url, db_config_info, source_row, max_age)
+
+    def _freshness_ttl(self):
+        try:
+            return max(0.0, float(self.fresh_for_field.value) * 3600)
+        except:
+            return DEFAULT_FRESHNESS_TTL
+
+    def _queue_rows(self, rows, db_config_info, source):
+        # Rows claimed from a source table; each is acknowledged when its
+        # output is stored. Duplicates only match jobs of the same source, so
+        # one scraped recently already has its output in the same table and
+        # is acknowledged right away; one still running waits for that job.
+        fresh = []
+        added = 0
+        for row_id, url in rows:
+            with self.duplicate_lock:
+                job_id = self._add_job(url, db_config_info, row_id)
+                if job_id is None:
+                    job = self.jobs.find_url(url, db_config_info)
+                    if job and job.status in ("in queue", "in progress"):
+                        self.duplicate_rows.setdefault(job.id, []).append(row_id)
+                    else:
+                        fresh.append(row_id)
+                    continue
+            added += 1
+            self._run_scraper(job_id, url, db_config_info, row_id)
+        source.ack(fresh)
+        return added
+
+    def _resume_jobs(self, jobs):
+        for job in jobs:
+            with self.held_lock:
+                if job.source and self._sink_for(job.source) is None:
+                    self.held_jobs.append(job)
+                    continue
+            self._run_scraper(job.id, job.url, job.source, job.source_row)
+
+    def _release_held_jobs(self):
+        # Called after connecting a database; jobs for another one stay held.
+        with self.held_lock:
+            jobs, self.held_jobs = self.held_jobs, []
+        if jobs:
+            threading.Thread(target=self._resume_jobs, args=(jobs,), daemon=True).start()
+
+    def _sink_for(self, db_config_info):
+        # The writer for the database a job's output goes to, if it is connected.
+        if db_config_info["type"] == "sqlite":
+            sink, database = self.sqlite_writer, self.sqlite_database
+        else:
+            sink, database = self.pg_sink, self.pg_database
+        if sink and db_config_info.get("database", database) == database:
+            return sink
+        return None
+
+    def _run_scraper(self, job_id, url, db_config_info=None, source_row=None):
+        self.runner.submit(
+            url,
+            callback=lambda url, result: self._finish_job(job_id, url, db_config_info, source_row, result),
+            on_start=lambda url: self.jobs.set_status(job_id, "in progress"),
         )
-        if job.get("db_config"):
-            db_type = job["db_config"]["type"]
-            output_table = job["db_config"].get("output_table", "scrape_output")
+
+    def _finish_job(self, job_id, url, db_config_info, source_row, result):
+        sink = self._sink_for(db_config_info) if db_config_info else None
+        if db_config_info and sink is None:
+            # The database was disconnected or switched while the job ran; it
+            # is scraped again once the database is back rather than finish
+            # without its output.
+            print(f"No connection for the output of job {job_id}; holding it until reconnected.")
+            with self.held_lock:
+                self.jobs.set_status(job_id, "in queue")
+                job = self.jobs.get(job_id)
+                if job:
+                    self.held_jobs.append(job)
+            return
+        status = "completed" if result.get("metadata", {}).get("statusCode") == 200 else "error"
+        self.job_results.put(job_id, result)
+        with self.duplicate_lock:
+            self.jobs.set_status(job_id, status)
+            duplicates = self.duplicate_rows.pop(job_id, [])
+        if db_config_info:
+            db_type = db_config_info["type"]
+            output_table = db_config_info.get("output_table", "scrape_output")
+            job = {"id": job_id, "url": url, "response": result, "status": status}
+            ack = None
+            if source_row is not None and db_config_info.get("source_table"):
+                ack = (db_config_info["source_table"], [source_row] + duplicates)
             try:
-                if db_type == "sqlite" and self.sqlite_conn:
-                    db_config.create_output_table_sqlite(self.sqlite_conn, output_table)
-                    db_config.store_output_sqlite(self.sqlite_conn, output_table, job)
-                elif db_type == "postgres" and self.pg_conn:
-                    db_config.create_output_table_postgres(self.pg_conn, output_table)
-                    db_config.store_output_postgres(self.pg_conn, output_table, job)
+                if db_type == "sqlite":
+                    if output_table not in self.sqlite_output_tables:
+                        # The DDL commits, so it runs on its own connection
+                        # rather than inside one of the writer's batches.
+                        conn = db_config.connect_sqlite(self.sqlite_database)
+                        try:
+                            db_config.create_output_table_sqlite(conn, output_table)
+                        finally:
+                            conn.close()
+                        self.sqlite_output_tables.add(output_table)
+                    db_config.queue_output_sqlite(sink, output_table, job, ack)
+                elif db_type == "postgres":
+                    sink.store(output_table, job, ack)
             except Exception as ex:
                 print(f"Error storing job output: {ex}")
-        self.page.update()
+
+    def _sqlite_output_failed(self, writer, op, args):
+        # Runs on the writer thread, which owns writer.conn. The job's source
+        # rows are given back so they are scraped again.
+        if op is not db_config.write_output_sqlite:
+            return
+        _, row, ack = args
+        self.jobs.set_status(row[0], "error")
+        if ack is not None:
+            try:
+                with writer.conn:
+                    db_config.release_claims_sqlite(writer.conn, *ack)
+            except Exception as ex:
+                print(f"Error releasing claims on {ack[0]}: {ex}")
+
+    def _pg_output_failed(self, table_name, row):
+        # The sink has already given the job's source rows back.
+        self.jobs.set_status(row[0], "error")
 
     # ─── JOBS TAB ───────────────────────────────────────────────
     def _create_jobs_tab(self):
-        self.job_list = ft.ListView(expand=True, width=350, padding=10, spacing=10)
+        self.job_list = ft.ListView(expand=True, padding=10, spacing=10)
+        self.job_counts_text = ft.Text(size=12)
+        self.job_page_text = ft.Text(size=12)
+        self.job_list_panel = ft.Column(
+            [
+                self.job_counts_text,
+                ft.Row(
+                    [
+                        ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, on_click=lambda e: self._change_job_page(-1)),
+                        self.job_page_text,
+                        ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, on_click=lambda e: self._change_job_page(1)),
+                    ],
+                    alignment="center",
+                ),
+                self.job_list,
+            ],
+            width=350,
+            spacing=5,
+        )
+        self._update_job_summary(0)
         self.job_detail = ft.Container(
             content=ft.Column(
                 [ft.Text("Select a job to view details", weight="bold")],
@@ -162,74 +353,145 @@ class ScraperApp:
             border_radius=10,
         )
 
-    def _update_job_list(self):
-        self.job_list.controls.clear()
-        for job in self.jobs:
-            if job["status"] == "completed":
-                card_color = ft.Colors.GREEN
-            elif job["status"] == "error":
-                card_color = ft.Colors.RED
-            else:
-                card_color = ft.Colors.YELLOW
-            job_card = ft.Card(
-                content=ft.Container(
-                    content=ft.Column(
-                        [
-                            ft.Text(f"Job {job['id']}", weight="bold"),
-                            ft.Text(job["url"], size=12, color=ft.Colors.BLUE),
-                            ft.Text(f"Status: {job['status']}", size=12),
-                        ],
-                        spacing=5,
-                    ),
-                    padding=10,
-                    bgcolor=card_color,
-                    border_radius=5,
-                    on_click=lambda e, job=job: self._show_job_detail(job),
-                )
-            )
-            self.job_list.controls.append(job_card)
+    def _job_card_color(self, status):
+        if status == "completed":
+            return ft.Colors.GREEN
+        elif status == "error":
+            return ft.Colors.RED
+        return ft.Colors.YELLOW
 
-    def _show_job_detail(self, job):
-        result = job.get("response", {})
-        json_response = json.dumps(result, indent=2) if result else "{}"
-        markdown_text = (
-            result.get("markdown", "No Markdown available.")
-            if result
-            else "No Markdown available."
+    def _build_job_card(self, job):
+        status_text = ft.Text(f"Status: {job.status}", size=12)
+        container = ft.Container(
+            content=ft.Column(
+                [
+                    ft.Text(f"Job {job.id}", weight="bold"),
+                    ft.Text(job.url, size=12, color=ft.Colors.BLUE),
+                    status_text,
+                ],
+                spacing=5,
+            ),
+            padding=10,
+            bgcolor=self._job_card_color(job.status),
+            border_radius=5,
+            on_click=lambda e, job_id=job.id: self._show_job_detail(job_id),
         )
+        self.job_cards[job.id] = (container, status_text)
+        return ft.Card(content=container)
+
+    def _update_job_summary(self, total):
+        pages = max(1, -(-total // JOBS_PAGE_SIZE))
+        self.job_counts_text.value = "  |  ".join(
+            f"{status.capitalize()}: {count}" for status, count in self.jobs.counts().items()
+        )
+        self.job_page_text.value = f"Page {self.job_page + 1} of {pages}  ({total} jobs)"
+
+    def _change_job_page(self, step):
+        pages = max(1, -(-len(self.jobs) // JOBS_PAGE_SIZE))
+        with self.job_list_lock:
+            page = min(max(self.job_page + step, 0), pages - 1)
+            if page == self.job_page:
+                return
+            self.job_page = page
+            updated = self._update_job_list()
+        if updated:
+            self.page.update()
+
+    def _update_job_list(self):
+        """
+        Apply job changes since the last call to the visible page of cards.
+
+        Only the page being shown is materialized. Cards already on it are
+        updated in place, so a tick sends only the controls that changed.
+        Returns True if anything needs to be pushed to the client. Callers
+        hold job_list_lock.
+        """
+        changed = self.jobs.drain_changes()
+        total = len(self.jobs)
+        start = self.job_page * JOBS_PAGE_SIZE
+        end = min(start + JOBS_PAGE_SIZE, total)
+        if not changed and (start, end) == self.rendered_range:
+            return False
+
+        if start != self.rendered_range[0]:
+            # Switched pages (or the list was cleared): rebuild this page only.
+            self.job_cards.clear()
+            self.job_list.controls = [self._build_job_card(job) for job in self.jobs.page(start, end - start)]
+        else:
+            # Same page, possibly with new jobs appended to it.
+            new_jobs = self.jobs.page(self.rendered_range[1], end - self.rendered_range[1])
+            self.job_list.controls.extend(self._build_job_card(job) for job in new_jobs)
+            for job_id in changed:
+                job = self.jobs.get(job_id) if job_id in self.job_cards else None
+                if job:
+                    container, status_text = self.job_cards[job_id]
+                    container.bgcolor = self._job_card_color(job.status)
+                    status_text.value = f"Status: {job.status}"
+        self.rendered_range = (start, end)
+        self._update_job_summary(total)
+        return True
+
+    def _show_job_detail(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        self.detail_job_id = job_id
+        summary = self.job_results.summary(job_id)
+        details = [f"Job ID: {job.id}", f"Submitted: {job.timestamp}"]
+        if summary:
+            details.append(f"Markdown: {summary.markdown_size:,} chars  |  HTML: {summary.html_size:,} chars")
         header = ft.Column(
             [
-                ft.Text(
-                    result.get("metadata", {}).get("title", "No Title"),
-                    weight="bold",
-                    size=24,
-                )
-                if result
-                else ft.Text("No Title", weight="bold", size=24),
-                ft.Text(
-                    result.get("metadata", {}).get("sourceURL", job["url"]),
-                    color=ft.Colors.BLUE,
-                    size=14,
-                )
-                if result
-                else ft.Text(job["url"], size=14),
-                ft.Text(f"Job ID: {job['id']}  |  Submitted: {job['timestamp']}", size=12, color=ft.Colors.GREY),
+                ft.Text(summary.title if summary and summary.title else "No Title", weight="bold", size=24),
+                ft.Text(job.url, color=ft.Colors.BLUE, size=14),
+                ft.Text("  |  ".join(details), size=12, color=ft.Colors.GREY),
             ],
             spacing=5,
         )
+        with self.detail_lock:
+            cached = self.detail_cache.get(job_id)
+            if cached:
+                self.detail_cache.move_to_end(job_id)
+        if cached:
+            self._render_job_detail(header, *cached)
+            return
+        # Loading and formatting a large result is slow; show the header
+        # straight away and do the rest off the UI thread.
+        self.job_detail.content = ft.Column(
+            [header, ft.Divider(), ft.ProgressRing()], expand=True, spacing=10
+        )
+        self.page.update()
+        threading.Thread(target=self._format_job_detail, args=(job_id, header), daemon=True).start()
+
+    def _format_job_detail(self, job_id, header):
+        result = self.job_results.get(job_id) or {}
+        markdown_text = result.get("markdown") or "No Markdown available."
+        json_response = json.dumps(result, indent=2) if result else "{}"
+        if result:
+            with self.detail_lock:
+                self.detail_cache[job_id] = (markdown_text, json_response)
+                while len(self.detail_cache) > DETAIL_CACHE_SIZE:
+                    self.detail_cache.popitem(last=False)
+        # Another job may have been selected in the meantime.
+        if self.detail_job_id == job_id:
+            self._render_job_detail(header, markdown_text, json_response)
+
+    def _render_job_detail(self, header, markdown_text, json_response):
         detail_tabs = ft.Tabs(
             tabs=[
                 ft.Tab(
                     text="Markdown",
                     content=ft.Container(
-                        content=ft.Markdown(markdown_text, expand=True),
+                        content=self._paged_view(markdown_text, lambda chunk: ft.Markdown(chunk)),
                         padding=10,
                     ),
                 ),
                 ft.Tab(
                     text="JSON",
                     content=ft.Container(
-                        content=ft.Text(json_response, font_family="monospace", expand=True),
+                        content=self._paged_view(
+                            json_response, lambda chunk: ft.Text(chunk, font_family="monospace")
+                        ),
                         padding=10,
                         bgcolor=ft.Colors.BLACK12,
                     ),
@@ -242,6 +504,32 @@ class ScraperApp:
         self.job_detail.content = detail_view
         self.page.update()
 
+    def _paged_view(self, text, make_control):
+        """
+        Show the first page of ``text`` with a button that appends the next.
+
+        Only the pages asked for become controls, so opening a job with
+        megabytes of markdown or JSON sends one page to the client.
+        """
+        view = ft.Column(expand=True, scroll=True, spacing=0)
+        more_button = ft.TextButton(text="Load more")
+        offset = 0
+
+        def load_more(e=None):
+            nonlocal offset
+            end = _page_end(text, offset)
+            view.controls.insert(len(view.controls) - 1, make_control(text[offset:end]))
+            offset = end
+            more_button.visible = offset < len(text)
+            more_button.text = f"Load more ({len(text) - offset:,} characters left)"
+            if e is not None:
+                self.page.update()
+
+        more_button.on_click = load_more
+        view.controls.append(more_button)
+        load_more()
+        return view
+
     # ─── DB CONFIG TAB ───────────────────────────────────────────────
     def _create_db_config_tab(self):
         # SQLite UI Elements.
@@ -314,6 +602,16 @@ class ScraperApp:
     def _load_sqlite_tables(self, e):
         try:
             self.sqlite_conn = db_config.connect_sqlite(self.sqlite_path_field.value)
+            if self.sqlite_writer:
+                self.sqlite_writer.close()
+            writer = db_config.SQLiteWriter(
+                self.sqlite_path_field.value,
+                on_error=lambda op, args: self._sqlite_output_failed(writer, op, args),
+            )
+            self.sqlite_writer = writer
+            self.sqlite_database = os.path.abspath(self.sqlite_path_field.value)
+            self.sqlite_output_tables = set()
+            self._release_held_jobs()
             tables = db_config.get_tables_sqlite(self.sqlite_conn)
             self.sqlite_table_dropdown.options = [ft.dropdown.Option(t) for t in tables]
             if tables:
@@ -332,41 +630,77 @@ class ScraperApp:
                 self.sqlite_column_dropdown.value = columns[0]
             self.page.update()
 
+    def _sqlite_source(self):
+        key = (
+            "sqlite",
+            self.sqlite_path_field.value,
+            self.sqlite_table_dropdown.value,
+            self.sqlite_column_dropdown.value,
+        )
+        if key not in self.sources:
+            self.sources[key] = SQLiteSource(*key[1:])
+        return key, self.sources[key]
+
+    def _sqlite_job_config(self):
+        return {
+            "type": "sqlite",
+            "database": self.sqlite_database,
+            "output_table": self.sqlite_output_field.value,
+            "source_table": self.sqlite_table_dropdown.value,
+        }
+
     def _add_urls_sqlite(self, e):
         if not self.sqlite_conn:
             self._show_snack("SQLite not connected")
             self.page.update()
             return
-        table = self.sqlite_table_dropdown.value
-        column = self.sqlite_column_dropdown.value
         try:
             batch_size = int(self.sqlite_batch_field.value)
         except:
             batch_size = 100
-        rows = db_config.fetch_urls_sqlite(self.sqlite_conn, table, column, batch_size, self.sqlite_last_id)
-        if rows:
-            self.sqlite_last_id = max(row[0] for row in rows)
-            for row in rows:
-                url = row[1]
-                new_job = self._add_job(url, {"type": "sqlite", "output_table": self.sqlite_output_field.value})
-                threading.Thread(target=self._run_scraper, args=(new_job,), daemon=True).start()
-            self._show_snack(f"Added {len(rows)} URLs from SQLite.")
+        _, source = self._sqlite_source()
+        self._queue_source_batch(source, batch_size, self._sqlite_job_config(), "SQLite")
         self.page.update()
 
+    def _queue_source_batch(self, source, batch_size, db_config_info, name):
+        # Queueing blocks once the runner's backlog is full, so claim and
+        # feed the batch from a background thread, as file uploads do.
+        def queue_batch():
+            try:
+                rows = source.fetch(batch_size)
+            except Exception as ex:
+                self._show_snack(f"Error reading from {name}: {ex}")
+                return
+            if rows:
+                added = self._queue_rows(rows, db_config_info, source)
+                self._show_snack(f"Added {added} URLs from {name}, {len(rows) - added} duplicates skipped.")
+
+        threading.Thread(target=queue_batch, daemon=True).start()
+
     def _start_polling_sqlite(self, e):
+        if not self.sqlite_conn:
+            self._show_snack("SQLite not connected")
+            return
         try:
             poll_interval = int(self.sqlite_poll_field.value)
         except:
             poll_interval = 5
-
-        def poll():
-            while True:
-                self._add_urls_sqlite(None)
-                time.sleep(poll_interval)
-
-        threading.Thread(target=poll, daemon=True).start()
-        self._show_snack("Started SQLite polling.")
-        self.page.update()
+        try:
+            batch_size = int(self.sqlite_batch_field.value)
+        except:
+            batch_size = 100
+        db_config_info = self._sqlite_job_config()
+        key, source = self._sqlite_source()
+        watcher = self.watchers.start(
+            key,
+            lambda: Watcher(
+                source,
+                lambda rows: self._queue_rows(rows, db_config_info, source),
+                batch_size,
+                poll_interval,
+            ),
+        )
+        self._show_snack("Started SQLite polling." if watcher else "Already polling this SQLite table.")
 
     def _connect_pg(self, e):
         try:
@@ -377,6 +711,18 @@ class ScraperApp:
                 self.pg_user_field.value,
                 self.pg_password_field.value,
             )
+            if self.pg_sink:
+                self.pg_sink.close()
+            self.pg_sink = db_config.PostgresSink(
+                self.pg_host_field.value,
+                self.pg_port_field.value,
+                self.pg_db_field.value,
+                self.pg_user_field.value,
+                self.pg_password_field.value,
+                on_error=self._pg_output_failed,
+            )
+            self.pg_database = self._pg_database()
+            self._release_held_jobs()
             tables = db_config.get_tables_postgres(self.pg_conn)
             self.pg_table_dropdown.options = [ft.dropdown.Option(t) for t in tables]
             if tables:
@@ -395,41 +741,82 @@ class ScraperApp:
                 self.pg_column_dropdown.value = columns[0]
             self.page.update()
 
+    def _pg_source(self):
+        key = (
+            "postgres",
+            (self.pg_host_field.value, self.pg_port_field.value, self.pg_db_field.value),
+            self.pg_table_dropdown.value,
+            self.pg_column_dropdown.value,
+        )
+        if key not in self.sources:
+            self.sources[key] = PostgresSource(
+                self.pg_host_field.value,
+                self.pg_port_field.value,
+                self.pg_db_field.value,
+                self.pg_user_field.value,
+                self.pg_password_field.value,
+                key[2],
+                key[3],
+            )
+        return key, self.sources[key]
+
+    def _pg_database(self):
+        # Identifies the server and database; credentials are not stored with jobs.
+        return f"{self.pg_host_field.value}:{self.pg_port_field.value}/{self.pg_db_field.value}"
+
+    def _pg_job_config(self):
+        return {
+            "type": "postgres",
+            "database": self.pg_database,
+            "output_table": self.pg_output_field.value,
+            "source_table": self.pg_table_dropdown.value,
+        }
+
     def _add_urls_pg(self, e):
         if not self.pg_conn:
             self._show_snack("PostgreSQL not connected")
             self.page.update()
             return
-        table = self.pg_table_dropdown.value
-        column = self.pg_column_dropdown.value
         try:
             batch_size = int(self.pg_batch_field.value)
         except:
             batch_size = 100
-        rows = db_config.fetch_urls_postgres(self.pg_conn, table, column, batch_size, self.pg_last_id)
-        if rows:
-            self.pg_last_id = max(row[0] for row in rows)
-            for row in rows:
-                url = row[1]
-                new_job = self._add_job(url, {"type": "postgres", "output_table": self.pg_output_field.value})
-                threading.Thread(target=self._run_scraper, args=(new_job,), daemon=True).start()
-            self._show_snack(f"Added {len(rows)} URLs from PostgreSQL.")
+        try:
+            _, source = self._pg_source()
+        except Exception as ex:
+            self._show_snack(f"Error connecting to PostgreSQL: {ex}")
+            return
+        self._queue_source_batch(source, batch_size, self._pg_job_config(), "PostgreSQL")
         self.page.update()
 
     def _start_polling_pg(self, e):
+        if not self.pg_conn:
+            self._show_snack("PostgreSQL not connected")
+            return
         try:
             poll_interval = int(self.pg_poll_field.value)
         except:
             poll_interval = 5
-
-        def poll():
-            while True:
-                self._add_urls_pg(None)
-                time.sleep(poll_interval)
-
-        threading.Thread(target=poll, daemon=True).start()
-        self._show_snack("Started PostgreSQL polling.")
-        self.page.update()
+        try:
+            batch_size = int(self.pg_batch_field.value)
+        except:
+            batch_size = 100
+        db_config_info = self._pg_job_config()
+        try:
+            key, source = self._pg_source()
+        except Exception as ex:
+            self._show_snack(f"Error connecting to PostgreSQL: {ex}")
+            return
+        watcher = self.watchers.start(
+            key,
+            lambda: Watcher(
+                source,
+                lambda rows: self._queue_rows(rows, db_config_info, source),
+                batch_size,
+                poll_interval,
+            ),
+        )
+        self._show_snack("Started PostgreSQL polling." if watcher else "Already polling this PostgreSQL table.")
 
     # ─── SETTINGS TAB ───────────────────────────────────────────────
     def _create_settings_tab(self):
@@ -438,10 +825,34 @@ class ScraperApp:
         self.clear_jobs_button = ft.ElevatedButton(
             text="Clear Job List", icon=ft.Icons.CLEAR_ALL, on_click=self._clear_jobs
         )
+        # Applies to file uploads and DB sources; Add Job always scrapes.
+        self.fresh_for_field = ft.TextField(
+            label="Skip URLs scraped within (hours, 0 = never skip)",
+            value=f"{DEFAULT_FRESHNESS_TTL / 3600:g}",
+            width=320,
+        )
+        # Politeness limits applied to every host; running jobs keep going.
+        self.host_rate_field = ft.TextField(
+            label="Requests per second per host", value=f"{DEFAULT_HOST_RATE:g}", width=220
+        )
+        self.host_burst_field = ft.TextField(
+            label="Burst per host", value=str(DEFAULT_HOST_BURST), width=140
+        )
+        self.host_in_flight_field = ft.TextField(
+            label="Concurrent requests per host", value=str(DEFAULT_HOST_MAX_IN_FLIGHT), width=220
+        )
+        self.host_limits_button = ft.ElevatedButton(
+            text="Apply Host Limits", on_click=self._apply_host_limits
+        )
         settings_column = ft.Column(
             [
                 ft.Text("Settings", size=24, weight="bold"),
                 ft.Row([self.theme_toggle, self.clear_jobs_button], spacing=20),
+                self.fresh_for_field,
+                ft.Row(
+                    [self.host_rate_field, self.host_burst_field, self.host_in_flight_field, self.host_limits_button],
+                    spacing=20,
+                ),
                 ft.Text("Customize the application settings here."),
             ],
             alignment="start",
@@ -449,6 +860,20 @@ class ScraperApp:
         )
         self.settings_tab = ft.Container(content=settings_column, padding=20)
 
+    def _apply_host_limits(self, e):
+        try:
+            rate = float(self.host_rate_field.value)
+            burst = float(self.host_burst_field.value)
+            max_in_flight = int(self.host_in_flight_field.value)
+        except:
+            self._show_snack("Host limits must be numbers.")
+            return
+        if rate <= 0 or burst < 1 or max_in_flight < 1:
+            self._show_snack("Host limits must be positive (burst and concurrency at least 1).")
+            return
+        self.runner.scheduler.set_limits(rate, burst, max_in_flight)
+        self._show_snack("Host limits applied.")
+
     def _on_theme_toggle(self, e):
         if self.theme_toggle.value:
             self.page.theme = self.dark_theme
@@ -462,7 +887,18 @@ class ScraperApp:
 
     def _clear_jobs(self, e):
         self.jobs.clear()
-        self.job_list.controls.clear()
+        self.job_results.clear()
+        with self.held_lock:
+            self.held_jobs = []
+        with self.detail_lock:
+            self.detail_cache.clear()
+        self.detail_job_id = None
+        with self.job_list_lock:
+            self.job_cards.clear()
+            self.job_page = 0
+            self.rendered_range = (0, 0)
+            self.job_list.controls.clear()
+            self._update_job_summary(0)
         self.job_detail.content = ft.Text("Job list cleared.", weight="bold")
         self._show_snack("Job list cleared.")
         self.page.update()
@@ -474,8 +910,10 @@ class ScraperApp:
 
     async def _periodic_update(self):
         while True:
-            self._update_job_list()
-            self.page.update()
+            with self.job_list_lock:
+                updated = self._update_job_list()
+            if updated:
+                self.page.update()
             await asyncio.sleep(1)
 
 
@@ -487,4 +925,6 @@ async def main(page: ft.Page):
     asyncio.create_task(app._periodic_update())
 
 
-ft.app(target=main)
+# Guarded so the scraper's parser processes can import this module safely.
+if __name__ == "__main__":
+    ft.app(target=main)
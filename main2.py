@@ -1,15 +1,27 @@
 # file_path/main.py
 
 import sys
+import time
+import zlib
 import sqlite3
+import hashlib
 import logging
 import json
-from scraper import run_job
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin
+from scraper import DEFAULT_FRESHNESS_TTL, canonicalize_url, run_job
+
+try:
+    import zstandard  # Optional: smaller and faster than zlib when installed
+except ImportError:
+    zstandard = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DB_FILE = "scraped_data.db"
+
 def create_table(conn: sqlite3.Connection) -> None:
     """
     Create the 'scraped_data' table if it does not exist.
@@ -34,43 +46,467 @@ def create_table(conn: sqlite3.Connection) -> None:
         headers TEXT,
         cookies TEXT,
         error TEXT,
-        rewrite TEXT
+        rewrite TEXT,
+        last_checked TEXT,
+        content_hash TEXT,
+        html_hash TEXT,
+        rewrite_state TEXT DEFAULT 'pending',
+        rewrite_attempts INTEGER DEFAULT 0,
+        rewrite_lease_until REAL,
+        rewrite_owner TEXT,
+        canonical_url TEXT
     );
     """
     conn.execute(create_table_sql)
+    # Raw HTML is stored once per distinct page body, compressed.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS page_content (
+        hash TEXT PRIMARY KEY,
+        codec TEXT,
+        data BLOB
+    );
+    """)
+    # Link and image graph: every URL is interned once in `urls`, and the
+    # edge tables are indexed in both directions.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS urls (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS page_links (
+        page_id INTEGER NOT NULL,
+        target_id INTEGER NOT NULL,
+        PRIMARY KEY (page_id, target_id)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS page_images (
+        page_id INTEGER NOT NULL,
+        image_id INTEGER NOT NULL,
+        PRIMARY KEY (page_id, image_id)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_page_links_target ON page_links (target_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_page_images_image ON page_images (image_id);")
+    _add_missing_columns(conn)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scraped_data_source_url ON scraped_data (source_url);"
+    )
+    # Nothing looks rows up by content_hash; earlier versions indexed it.
+    conn.execute("DROP INDEX IF EXISTS idx_scraped_data_content_hash;")
+    # Freshness lookups only ever ask about successful scrapes.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scraped_data_canonical_url ON scraped_data (canonical_url, last_checked) "
+        "WHERE status_code = 200;"
+    )
+    # Only rows still waiting for the rewriter are indexed, so claiming work
+    # never scans the (large) finished rows.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scraped_data_rewrite_queue ON scraped_data (id, rewrite_lease_until) "
+        "WHERE rewrite_state IN ('pending', 'in_progress');"
+    )
     conn.commit()
 
-def store_result(conn: sqlite3.Connection, result: dict) -> None:
+# Columns added after the first release, with their SQL types. Databases
+# created by older versions get them on the next create_table() call.
+ADDED_COLUMNS = {
+    "last_checked": "TEXT",
+    "content_hash": "TEXT",
+    "html_hash": "TEXT",
+    "rewrite_state": "TEXT DEFAULT 'pending'",
+    "rewrite_attempts": "INTEGER DEFAULT 0",
+    "rewrite_lease_until": "REAL",
+    "rewrite_owner": "TEXT",
+    "canonical_url": "TEXT",
+}
+
+# Statements that bring existing rows in line when a column is added.
+COLUMN_BACKFILLS = {
+    "rewrite_state": "UPDATE scraped_data SET rewrite_state = 'done' WHERE rewrite IS NOT NULL AND rewrite != '';",
+    "canonical_url": "UPDATE scraped_data SET canonical_url = canonicalize_url(source_url) WHERE source_url IS NOT NULL;",
+}
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(scraped_data);")}
+    conn.create_function("canonicalize_url", 1, canonicalize_url, deterministic=True)
+    for column, column_type in ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE scraped_data ADD COLUMN {column} {column_type};")
+            if column in COLUMN_BACKFILLS:
+                conn.execute(COLUMN_BACKFILLS[column])
+
+def compress_text(text: str) -> Tuple[str, bytes]:
     """
-    Store the scraping result into the SQLite database.
+    Compress text for BLOB storage with zstd if available, zlib otherwise.
+    
+    Args:
+        text (str): The text to compress.
+        
+    Returns:
+        tuple: The codec name and the compressed bytes.
+    """
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+def decompress_text(codec: str, data: bytes) -> str:
+    """
+    Reverse ``compress_text``.
+    
+    Args:
+        codec (str): The codec name stored with the data.
+        data (bytes): The compressed bytes.
+        
+    Returns:
+        str: The original text.
+    """
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed content")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+def html_key(html: str) -> str:
+    """
+    Content address of a raw HTML body in the page_content table.
+    
+    Args:
+        html (str): The raw HTML.
+        
+    Returns:
+        str: Hex digest of the exact body.
+    """
+    return hashlib.blake2b(html.encode("utf-8"), digest_size=20).hexdigest()
+
+def load_html(conn: sqlite3.Connection, scrape_id: str) -> str:
+    """
+    Read and decompress the raw HTML stored for a scrape.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        scrape_id (str): The scrape to load.
+        
+    Returns:
+        str: The HTML, or an empty string if none was stored.
+    """
+    row = conn.execute(
+        "SELECT d.html, c.codec, c.data FROM scraped_data d "
+        "LEFT JOIN page_content c ON c.hash = d.html_hash WHERE d.scrape_id = ?;",
+        (scrape_id,),
+    ).fetchone()
+    if row is None:
+        return ""
+    html, codec, data = row
+    if data is not None:
+        return decompress_text(codec, data)
+    # Rows written before compressed storage keep their HTML inline.
+    return html or ""
+
+def migrate_html_storage(conn: sqlite3.Connection, batch_size: int = 500) -> int:
+    """
+    Move inline HTML of existing rows into compressed page_content storage.
+    
+    Rows are converted in id order, one transaction per batch, so the
+    migration can be interrupted and resumed. Run VACUUM afterwards to
+    return the freed pages to the file system.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        batch_size (int): Rows converted per transaction.
+        
+    Returns:
+        int: Number of rows migrated.
+    """
+    create_table(conn)
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, html FROM scraped_data WHERE id > ? AND html_hash IS NULL "
+            "AND html IS NOT NULL AND html != '' ORDER BY id LIMIT ?;",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return migrated
+        with conn:
+            for row_id, html in rows:
+                key = html_key(html)
+                conn.execute(
+                    "INSERT OR IGNORE INTO page_content (hash, codec, data) VALUES (?, ?, ?);",
+                    (key, *compress_text(html)),
+                )
+                conn.execute(
+                    "UPDATE scraped_data SET html = NULL, html_hash = ? WHERE id = ?;",
+                    (key, row_id),
+                )
+        migrated += len(rows)
+        last_id = rows[-1][0]
+        logger.info(f"Migrated HTML of {migrated} row(s) to compressed storage.")
+
+INTERN_URL_SQL = "INSERT OR IGNORE INTO urls (url) VALUES (?);"
+CLEAR_LINKS_SQL = "DELETE FROM page_links WHERE page_id = (SELECT id FROM urls WHERE url = ?);"
+CLEAR_IMAGES_SQL = "DELETE FROM page_images WHERE page_id = (SELECT id FROM urls WHERE url = ?);"
+INSERT_LINK_SQL = """
+INSERT OR IGNORE INTO page_links (page_id, target_id)
+SELECT (SELECT id FROM urls WHERE url = ?), (SELECT id FROM urls WHERE url = ?);
+"""
+INSERT_IMAGE_SQL = """
+INSERT OR IGNORE INTO page_images (page_id, image_id)
+SELECT (SELECT id FROM urls WHERE url = ?), (SELECT id FROM urls WHERE url = ?);
+"""
+
+def resolve_urls(base_url: str, refs: Iterable[str]) -> List[str]:
+    """
+    Resolve href/src values against the page URL.
+    
+    Fragments are dropped, non-HTTP schemes (mailto:, javascript:, data:)
+    are skipped and duplicates are removed, keeping document order.
+    
+    Args:
+        base_url (str): URL of the page the references appear on.
+        refs (iterable): Raw href or src values.
+        
+    Returns:
+        list: Absolute http(s) URLs.
+    """
+    resolved = {}
+    for ref in refs:
+        if not ref:
+            continue
+        try:
+            url = urldefrag(urljoin(base_url, ref.strip()))[0]
+        except ValueError:
+            continue
+        if url.startswith(("http://", "https://")):
+            resolved.setdefault(url, None)
+    return list(resolved)
+
+def graph_statements(
+    page_url: str,
+    base_url: str,
+    links: Iterable[str],
+    images: Iterable[str]
+) -> List[Tuple[str, tuple]]:
+    """
+    Build the statements that replace a page's edges in the link graph.
+    
+    Statements of the same kind are emitted back to back so a batching
+    writer can send each group as one executemany.
+    
+    Args:
+        page_url (str): The page's source URL (its node in the graph).
+        base_url (str): URL relative references are resolved against.
+        links (iterable): Raw href values found on the page.
+        images (iterable): Raw img src values found on the page.
+        
+    Returns:
+        list: ``(sql, params)`` pairs to execute in order.
+    """
+    targets = resolve_urls(base_url, links)
+    image_urls = resolve_urls(base_url, images)
+    statements = [(INTERN_URL_SQL, (url,)) for url in [page_url, *targets, *image_urls]]
+    statements.append((CLEAR_LINKS_SQL, (page_url,)))
+    statements.append((CLEAR_IMAGES_SQL, (page_url,)))
+    statements.extend((INSERT_LINK_SQL, (page_url, url)) for url in targets)
+    statements.extend((INSERT_IMAGE_SQL, (page_url, url)) for url in image_urls)
+    return statements
+
+def outbound_links(conn: sqlite3.Connection, page_url: str) -> List[str]:
+    """
+    List the URLs a page links to.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        page_url (str): Source URL of the page.
+        
+    Returns:
+        list: Absolute target URLs.
+    """
+    rows = conn.execute(
+        "SELECT t.url FROM urls p JOIN page_links l ON l.page_id = p.id "
+        "JOIN urls t ON t.id = l.target_id WHERE p.url = ?;",
+        (page_url,),
+    )
+    return [row[0] for row in rows]
+
+def inbound_links(conn: sqlite3.Connection, url: str) -> List[str]:
+    """
+    List the scraped pages that link to a URL.
     
     Args:
         conn (sqlite3.Connection): The database connection.
+        url (str): Absolute target URL.
+        
+    Returns:
+        list: Source URLs of the linking pages.
+    """
+    rows = conn.execute(
+        "SELECT p.url FROM urls t JOIN page_links l ON l.target_id = t.id "
+        "JOIN urls p ON p.id = l.page_id WHERE t.url = ?;",
+        (url,),
+    )
+    return [row[0] for row in rows]
+
+def pages_with_image(conn: sqlite3.Connection, image_url: str) -> List[str]:
+    """
+    List the scraped pages that embed an image.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        image_url (str): Absolute image URL.
+        
+    Returns:
+        list: Source URLs of the pages.
+    """
+    rows = conn.execute(
+        "SELECT p.url FROM urls i JOIN page_images g ON g.image_id = i.id "
+        "JOIN urls p ON p.id = g.page_id WHERE i.url = ?;",
+        (image_url,),
+    )
+    return [row[0] for row in rows]
+
+def backfill_link_graph(conn: sqlite3.Connection, batch_size: int = 500) -> int:
+    """
+    Fill the link graph from the JSON link/image columns of existing rows.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        batch_size (int): Rows processed per transaction.
+        
+    Returns:
+        int: Number of rows processed.
+    """
+    create_table(conn)
+    processed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, source_url, final_url, links, images FROM scraped_data "
+            "WHERE id > ? AND status_code = 200 ORDER BY id LIMIT ?;",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return processed
+        with conn:
+            for _, source_url, final_url, links, images in rows:
+                for sql, params in graph_statements(
+                    source_url, final_url or source_url, json.loads(links or "[]"), json.loads(images or "[]")
+                ):
+                    conn.execute(sql, params)
+        processed += len(rows)
+        last_id = rows[-1][0]
+        logger.info(f"Added links of {processed} row(s) to the link graph.")
+
+def previous_scrape(conn: sqlite3.Connection, url: str) -> Optional[Dict[str, Any]]:
+    """
+    Look up the validators and content hash stored with the last successful
+    scrape of a URL.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        url (str): The source URL.
+        
+    Returns:
+        dict: ``etag``, ``last_modified`` and ``content_hash`` values (any
+              may be None), or None if the URL was never scraped successfully.
+    """
+    row = conn.execute(
+        "SELECT headers, content_hash FROM scraped_data WHERE source_url = ? AND status_code = 200 "
+        "ORDER BY id DESC LIMIT 1;",
+        (url,),
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        headers = {key.lower(): value for key, value in json.loads(row[0] or "{}").items()}
+    except (ValueError, AttributeError):
+        headers = {}
+    return {
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "content_hash": row[1],
+    }
+
+def recently_scraped(conn: sqlite3.Connection, url: str, max_age: float = DEFAULT_FRESHNESS_TTL) -> bool:
+    """
+    Check whether a URL, in any of its non-canonical forms, was scraped
+    successfully (or found unchanged) within ``max_age`` seconds.
+    
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        url (str): The URL.
+        max_age (float): Freshness TTL in seconds.
+        
+    Returns:
+        bool: True if the stored copy is fresh enough to skip the URL.
+    """
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - max_age))
+    row = conn.execute(
+        "SELECT 1 FROM scraped_data WHERE canonical_url = ? AND status_code = 200 AND last_checked >= ? LIMIT 1;",
+        (canonicalize_url(url), cutoff),
+    ).fetchone()
+    return row is not None
+
+INSERT_RESULT_SQL = """
+INSERT OR REPLACE INTO scraped_data (
+    scrape_id,
+    title,
+    viewport,
+    source_url,
+    final_url,
+    status_code,
+    markdown,
+    html,
+    meta_description,
+    meta_keywords,
+    open_graph,
+    links,
+    images,
+    structured_data,
+    headers,
+    cookies,
+    error,
+    last_checked,
+    content_hash,
+    html_hash,
+    canonical_url
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+# Identical bodies (mirrors, unchanged re-scrapes) share one stored copy.
+INSERT_CONTENT_SQL = "INSERT OR IGNORE INTO page_content (hash, codec, data) VALUES (?, ?, ?);"
+
+# The stored copy is still current; only record that we checked.
+TOUCH_RESULT_SQL = """
+UPDATE scraped_data SET last_checked = ? WHERE id =
+    (SELECT MAX(id) FROM scraped_data WHERE source_url = ? AND status_code = 200);
+"""
+
+def result_statements(result: dict) -> List[Tuple[str, tuple]]:
+    """
+    Build the SQL statements that record a scraping result.
+    
+    Args:
         result (dict): The scraping result from run_job().
+        
+    Returns:
+        list: ``(sql, params)`` pairs to execute in order.
     """
     metadata = result.get("metadata", {})
+    checked_at = time.strftime("%Y-%m-%d %H:%M:%S")
     
-    insert_sql = """
-    INSERT OR REPLACE INTO scraped_data (
-        scrape_id,
-        title,
-        viewport,
-        source_url,
-        final_url,
-        status_code,
-        markdown,
-        html,
-        meta_description,
-        meta_keywords,
-        open_graph,
-        links,
-        images,
-        structured_data,
-        headers,
-        cookies,
-        error
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
+    if result.get("not_modified"):
+        return [(TOUCH_RESULT_SQL, (checked_at, metadata.get("sourceURL", "")))]
+    
+    statements = []
+    html = metadata.get("html", "")
+    key = None
+    if html:
+        key = html_key(html)
+        statements.append((INSERT_CONTENT_SQL, (key, *compress_text(html))))
     
     data = (
         result.get("scrape_id", ""),
@@ -80,7 +516,7 @@ def store_result(conn: sqlite3.Connection, result: dict) -> None:
         metadata.get("url", ""),
         metadata.get("statusCode", None),
         result.get("markdown", ""),
-        metadata.get("html", ""),
+        None,  # raw HTML lives in page_content; see load_html()
         metadata.get("meta_description", ""),
         metadata.get("meta_keywords", ""),
         json.dumps(metadata.get("open_graph", {})),
@@ -89,25 +525,50 @@ def store_result(conn: sqlite3.Connection, result: dict) -> None:
         json.dumps(metadata.get("structured_data", [])),
         json.dumps(metadata.get("headers", {})),
         json.dumps(metadata.get("cookies", {})),
-        result.get("error", "")
+        result.get("error", ""),
+        checked_at,
+        result.get("content_hash"),
+        key,
+        canonicalize_url(metadata.get("sourceURL", "")),
     )
+    statements.append((INSERT_RESULT_SQL, data))
+    if metadata.get("statusCode") == 200:
+        statements.extend(graph_statements(
+            metadata.get("sourceURL", ""),
+            metadata.get("url") or metadata.get("sourceURL", ""),
+            metadata.get("links", []),
+            metadata.get("images", []),
+        ))
+    return statements
+
+def store_result(conn: sqlite3.Connection, result: dict) -> None:
+    """
+    Store the scraping result into the SQLite database.
     
-    conn.execute(insert_sql, data)
+    Args:
+        conn (sqlite3.Connection): The database connection.
+        result (dict): The scraping result from run_job().
+    """
+    for sql, params in result_statements(result):
+        conn.execute(sql, params)
     conn.commit()
 
 def main(url: str) -> None:
     """
     Scrape the provided URL and store the result in the SQLite database.
+    A URL scraped before is re-fetched conditionally, and a page that is
+    unchanged (304 or same content hash) only has its last_checked
+    timestamp updated.
     
     Args:
         url (str): The URL to scrape.
     """
     # Connect to (or create) the SQLite database
-    conn = sqlite3.connect("scraped_data.db")
+    conn = sqlite3.connect(DB_FILE)
     create_table(conn)
     
     logger.info(f"Scraping URL: {url}")
-    result = run_job(url)
+    result = run_job(url, previous=previous_scrape(conn, url))
     
     store_result(conn, result)
     
@@ -115,6 +576,14 @@ def main(url: str) -> None:
     conn.close()
 
 if __name__ == "__main__":
+    if sys.argv[1:] == ["--migrate-html"]:
+        with sqlite3.connect(DB_FILE) as migrate_conn:
+            migrate_html_storage(migrate_conn)
+        sys.exit(0)
+    if sys.argv[1:] == ["--backfill-links"]:
+        with sqlite3.connect(DB_FILE) as migrate_conn:
+            backfill_link_graph(migrate_conn)
+        sys.exit(0)
     if len(sys.argv) > 1:
         target_url = sys.argv[1]
     else:
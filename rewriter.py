@@ -1,8 +1,16 @@
 # file_path/main3.py
 
+import os
+import time
 import sqlite3
+import hashlib
 import logging
+from difflib import SequenceMatcher
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple
 import ollama  # Ensure you have installed ollama-python (pip install ollama)
+from main2 import create_table
+from db_config import worker_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,21 +18,52 @@ logger = logging.getLogger(__name__)
 
 MODEL_NAME = "llama3.2"
 DB_FILE = "scraped_data.db"
+# Ollama server to use; None falls back to the library default (localhost).
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")
+# Requests kept in flight against the Ollama server.
+CONCURRENCY = 4
+# Pending rows claimed per query, and rewrites written per transaction.
+PAGE_SIZE = 100
+COMMIT_BATCH = 20
+# Claimed rows are leased for LEASE_SECONDS and the lease is renewed while
+# they are being worked on; a row that fails is retried after RETRY_DELAY
+# seconds and marked failed after MAX_ATTEMPTS.
+LEASE_SECONDS = 600
+RETRY_DELAY = 300
+MAX_ATTEMPTS = 5
+PROMPT_TEMPLATE = "Rewrite the following content in a better style:\n\n{content}"
+# Rewrite cache limits: entries kept, and age in seconds before expiry.
+CACHE_MAX_ENTRIES = 50000
+CACHE_MAX_AGE = 30 * 24 * 3600
+# Documents are rewritten in chunks of consecutive paragraphs of up to this
+# many tokens, estimated at CHARS_PER_TOKEN characters each; failed chunks
+# are retried.
+CHUNK_TOKENS = 1500
+CHARS_PER_TOKEN = 4
+CHUNK_RETRIES = 2
+# Once a chunk holds a quarter of the budget, it also ends before a heading
+# and after roughly one in SEGMENT_SPREAD paragraphs (picked by content hash),
+# so boundaries only move near an edit and unchanged chunks can be reused.
+SEGMENT_SPREAD = 4
 
+_client = ollama.Client(host=OLLAMA_HOST)
 
-def rewrite_with_ollama(content: str) -> str:
+
+def rewrite_with_ollama(content: str, client: Optional[ollama.Client] = None) -> str:
     """
     Rewrite the provided content using the Ollama LLM.
 
     Args:
         content (str): Original markdown content.
+        client (ollama.Client, optional): Client to use instead of the
+            module-wide one.
 
     Returns:
         str: Rewritten content if successful; otherwise, an empty string.
     """
-    prompt = f"Rewrite the following content in a better style:\n\n{content}"
+    prompt = PROMPT_TEMPLATE.format(content=content)
     try:
-        result = ollama.chat(MODEL_NAME, messages=[{"role": "user", "content": prompt}])
+        result = (client or _client).chat(MODEL_NAME, messages=[{"role": "user", "content": prompt}])
         # Check for expected response structure
         if "choices" in result and result["choices"]:
             return result["choices"][0]["message"]["content"].strip()
@@ -38,6 +77,349 @@ def rewrite_with_ollama(content: str) -> str:
         return ""
 
 
+def rewrite_chunk(content: str, retries: int = CHUNK_RETRIES, client: Optional[ollama.Client] = None) -> str:
+    """
+    Rewrite one chunk, retrying with exponential backoff on failure.
+
+    Args:
+        content (str): Markdown chunk.
+        retries (int): Extra attempts after the first one fails.
+        client (ollama.Client, optional): Client to use instead of the
+            module-wide one.
+
+    Returns:
+        str: Rewritten chunk if any attempt succeeded; otherwise, an empty string.
+    """
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(2 ** (attempt - 1))
+            logger.info(f"Retrying chunk rewrite (attempt {attempt + 1}/{retries + 1}).")
+        rewritten = rewrite_with_ollama(content, client)
+        if rewritten:
+            return rewritten
+    return ""
+
+
+def _markdown_blocks(markdown: str) -> List[str]:
+    """
+    Split markdown into blocks at blank lines and before headings, keeping
+    fenced code blocks whole.
+    """
+    blocks: List[str] = []
+    lines: List[str] = []
+    in_fence = False
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            in_fence = not in_fence
+        elif not in_fence and (not stripped or stripped.startswith("#")):
+            if lines:
+                blocks.append("\n".join(lines))
+                lines = []
+            if not stripped:
+                continue
+        lines.append(line)
+    if lines:
+        blocks.append("\n".join(lines))
+    return blocks
+
+
+def _split_block(block: str, limit: int) -> List[str]:
+    """
+    Split a single oversized block on line boundaries, wrapping lines that
+    are still too long at the last space that fits.
+    """
+    pieces: List[str] = []
+    current = ""
+    for line in block.split("\n"):
+        if not line:
+            if current and len(current) < limit:
+                current += "\n"
+            continue
+        while line:
+            room = limit - len(current) - 1 if current else limit
+            if len(line) <= room:
+                current = f"{current}\n{line}" if current else line
+                break
+            cut = line.rfind(" ", 0, room + 1) if room > 0 else -1
+            if cut <= 0:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                    continue
+                cut = room
+            head, line = line[:cut], line[cut:].lstrip(" ")
+            pieces.append(f"{current}\n{head}" if current else head)
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _segment_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def split_markdown(markdown: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Split markdown into chunks of at most ``max_tokens`` (estimated) tokens.
+
+    Consecutive paragraphs are packed into a chunk, so the model sees them
+    in context, and chunks are cut on heading and paragraph boundaries.
+    Boundaries depend on the paragraphs around them rather than on offsets
+    or the document's length, so an edit only changes the chunk it falls
+    in (and at most its neighbours), and every other chunk keeps its
+    previous rewrite, on short pages as on long ones.
+
+    Args:
+        markdown (str): Markdown content.
+        max_tokens (int): Token budget per chunk.
+
+    Returns:
+        List[str]: Chunks in document order.
+    """
+    limit = max(1, max_tokens * CHARS_PER_TOKEN)
+    chunks: List[str] = []
+    current = ""
+    for block in _markdown_blocks(markdown):
+        if len(block) > limit:
+            # Split together with what precedes it, so a heading stays with
+            # the start of its section.
+            pieces = _split_block(f"{current}\n\n{block}" if current else block, limit)
+            chunks.extend(pieces[:-1])
+            current = pieces[-1]
+            continue
+        if current and (
+            len(current) + 2 + len(block) > limit
+            or (len(current) >= limit // 4 and block.lstrip().startswith("#"))
+        ):
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+        if len(current) >= limit // 4 and _segment_hash(block)[0] % SEGMENT_SPREAD == 0:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def create_segment_table(conn: sqlite3.Connection) -> None:
+    """
+    Create the table holding each page's last rewrite as aligned segments.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rewrite_segments (
+        source_url TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        source_hash BLOB NOT NULL,
+        source TEXT,
+        rewrite TEXT,
+        PRIMARY KEY (source_url, position)
+    ) WITHOUT ROWID;
+    """)
+    conn.commit()
+
+
+def reuse_segments(conn: sqlite3.Connection, source_url: str, chunks: List[str]) -> List[Optional[str]]:
+    """
+    Match a page's new chunks against the segments of its previous rewrite.
+
+    The old and new segment hashes are aligned with a sequence diff, so
+    unchanged paragraphs keep their rewrite even when others were inserted,
+    removed or edited around them.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+        source_url (str): The page the markdown belongs to.
+        chunks (List[str]): The page's current chunks.
+
+    Returns:
+        List[Optional[str]]: The previous rewrite of each chunk, or None
+        where the chunk is new or changed.
+    """
+    rows = conn.execute(
+        "SELECT source_hash, rewrite FROM rewrite_segments WHERE source_url = ? ORDER BY position;",
+        (source_url,),
+    ).fetchall()
+    reused: List[Optional[str]] = [None] * len(chunks)
+    if not rows:
+        return reused
+    old = [bytes(row[0]) for row in rows]
+    new = [_segment_hash(chunk) for chunk in chunks]
+    for a, b, size in SequenceMatcher(None, old, new, autojunk=False).get_matching_blocks():
+        for offset in range(size):
+            reused[b + offset] = rows[a + offset][1]
+    return reused
+
+
+def save_segments(conn: sqlite3.Connection, source_url: str, chunks: List[str], rewrites: List[str]) -> None:
+    """
+    Replace a page's stored segments; committed with the caller's next
+    transaction.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+        source_url (str): The page the markdown belongs to.
+        chunks (List[str]): Source chunks in document order.
+        rewrites (List[str]): The rewrite of each chunk.
+    """
+    conn.execute("DELETE FROM rewrite_segments WHERE source_url = ?;", (source_url,))
+    conn.executemany(
+        "INSERT INTO rewrite_segments (source_url, position, source_hash, source, rewrite) VALUES (?, ?, ?, ?, ?);",
+        [
+            (source_url, position, _segment_hash(chunk), chunk, rewrite)
+            for position, (chunk, rewrite) in enumerate(zip(chunks, rewrites))
+        ],
+    )
+
+
+class RewriteCache:
+    """
+    Persistent cache of rewrites keyed by model, prompt template and content.
+
+    Identical markdown (an unchanged re-scrape, or boilerplate shared by
+    many URLs) is only sent to the model once per model and prompt. Entries
+    older than ``max_age`` seconds are expired and only the ``max_entries``
+    most recently used are kept. New entries and usage updates are buffered
+    until ``write()``, so no write transaction is held open in between.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        model: str = MODEL_NAME,
+        prompt_template: str = PROMPT_TEMPLATE,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_age: float = CACHE_MAX_AGE,
+    ):
+        """
+        Args:
+            conn (sqlite3.Connection): Active database connection.
+            model (str): Model whose rewrites are cached.
+            prompt_template (str): Prompt the rewrites were produced with.
+            max_entries (int): Entries kept after eviction.
+            max_age (float): Seconds after which an entry expires.
+        """
+        self.conn = conn
+        self.model = model
+        self.prompt_template = prompt_template
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._new: Dict[str, str] = {}
+        self._used: Dict[str, float] = {}
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS rewrite_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            rewrite TEXT,
+            created_at REAL,
+            last_used REAL
+        );
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rewrite_cache_last_used ON rewrite_cache (last_used);")
+        conn.commit()
+
+    def key(self, content: str) -> str:
+        """
+        Args:
+            content (str): Markdown to be rewritten.
+
+        Returns:
+            str: Cache key for the content under this model and prompt.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        for part in (self.model, self.prompt_template, content):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, content: str) -> Optional[str]:
+        """
+        Look up a cached rewrite.
+
+        Args:
+            content (str): Markdown to be rewritten.
+
+        Returns:
+            str: The cached rewrite, or None on a miss.
+        """
+        key = self.key(content)
+        if key in self._new:
+            self.hits += 1
+            return self._new[key]
+        row = self.conn.execute(
+            "SELECT rewrite, created_at FROM rewrite_cache WHERE key = ?;", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used[key] = now
+        return row[0]
+
+    def put(self, content: str, rewrite: str) -> None:
+        """
+        Store a rewrite on the next ``write()``.
+
+        Args:
+            content (str): The markdown that was rewritten.
+            rewrite (str): The model's rewrite.
+        """
+        self._new[self.key(content)] = rewrite
+
+    def write(self) -> None:
+        """
+        Write buffered entries and usage updates; committed with the
+        caller's transaction.
+        """
+        now = time.time()
+        if self._new:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rewrite_cache (key, model, rewrite, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?);",
+                [(key, self.model, rewrite, now, now) for key, rewrite in self._new.items()],
+            )
+            self._new.clear()
+        if self._used:
+            self.conn.executemany(
+                "UPDATE rewrite_cache SET last_used = ? WHERE key = ?;",
+                [(used, key) for key, used in self._used.items()],
+            )
+            self._used.clear()
+
+    def evict(self) -> int:
+        """
+        Drop expired entries and the least recently used ones over the limit.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        with self.conn:
+            expired = self.conn.execute(
+                "DELETE FROM rewrite_cache WHERE created_at < ?;", (time.time() - self.max_age,)
+            ).rowcount
+            overflow = self.conn.execute(
+                "DELETE FROM rewrite_cache WHERE key IN "
+                "(SELECT key FROM rewrite_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?);",
+                (self.max_entries,),
+            ).rowcount
+        return expired + overflow
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: ``hits`` and ``misses`` since the cache was opened.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
 def update_rewrite_in_db(conn: sqlite3.Connection, record_id: int, rewrite_content: str) -> None:
     """
     Update the 'rewrite' column for a specific record in the database.
@@ -47,41 +429,269 @@ def update_rewrite_in_db(conn: sqlite3.Connection, record_id: int, rewrite_conte
         record_id (int): ID of the record to update.
         rewrite_content (str): Rewritten content.
     """
-    update_sql = "UPDATE scraped_data SET rewrite = ? WHERE id = ?;"
-    conn.execute(update_sql, (rewrite_content, record_id))
-    conn.commit()
+    update_rewrites_in_db(conn, [(record_id, rewrite_content)])
+
+
+def update_rewrites_in_db(conn: sqlite3.Connection, rewrites: List[Tuple[int, str]]) -> None:
+    """
+    Write several rewrites back in a single transaction and mark the
+    records done.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+        rewrites (list): ``(record_id, rewrite_content)`` pairs.
+    """
+    update_sql = (
+        "UPDATE scraped_data SET rewrite = ?, rewrite_state = 'done', rewrite_lease_until = NULL, "
+        "rewrite_owner = NULL WHERE id = ?;"
+    )
+    with conn:
+        conn.executemany(update_sql, [(content, record_id) for record_id, content in rewrites])
 
 
-def process_records(conn: sqlite3.Connection) -> None:
+def claim_pending_records(
+    conn: sqlite3.Connection,
+    owner: str,
+    limit: int = PAGE_SIZE,
+    lease_seconds: float = LEASE_SECONDS,
+) -> List[Tuple[int, str, str]]:
+    """
+    Atomically lease a batch of records that need a rewrite.
+
+    Pending rows, and in-progress rows whose lease has expired (their worker
+    died), are taken in id order through the partial rewrite-queue index.
+    Several rewriter processes can claim from the same database without
+    picking the same rows.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+        owner (str): Worker id recorded on the lease.
+        limit (int): Maximum rows to claim.
+        lease_seconds (float): How long the rows are reserved.
+
+    Returns:
+        list: ``(record_id, source_url, markdown)`` tuples in id order.
+    """
+    now = time.time()
+    claim_sql = """
+    UPDATE scraped_data
+    SET rewrite_state = 'in_progress', rewrite_owner = ?, rewrite_lease_until = ?,
+        rewrite_attempts = COALESCE(rewrite_attempts, 0) + 1
+    WHERE id IN (
+        SELECT id FROM scraped_data
+        WHERE rewrite_state IN ('pending', 'in_progress') AND COALESCE(rewrite_lease_until, 0) < ?
+        ORDER BY id LIMIT ?
+    )
+    RETURNING id, source_url, markdown;
+    """
+    with conn:
+        rows = conn.execute(claim_sql, (owner, now + lease_seconds, now, limit)).fetchall()
+    return sorted(rows)
+
+
+def renew_leases(conn: sqlite3.Connection, owner: str, record_ids: Iterable[int], lease_seconds: float = LEASE_SECONDS) -> None:
+    """
+    Extend the leases this worker holds on records still being rewritten.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+        owner (str): Worker id the leases were claimed with.
+        record_ids (Iterable[int]): Records still in progress.
+        lease_seconds (float): New lease length from now.
+    """
+    until = time.time() + lease_seconds
+    with conn:
+        conn.executemany(
+            "UPDATE scraped_data SET rewrite_lease_until = ? WHERE id = ? AND rewrite_owner = ?;",
+            [(until, record_id, owner) for record_id in record_ids],
+        )
+
+
+def release_failed_records(
+    conn: sqlite3.Connection,
+    record_ids: Iterable[int],
+    max_attempts: int = MAX_ATTEMPTS,
+    retry_delay: float = RETRY_DELAY,
+) -> None:
+    """
+    Put failed records back in the queue after ``retry_delay`` seconds, or
+    mark them failed once they have used up ``max_attempts``; committed
+    with the caller's transaction.
+
+    Args:
+        conn (sqlite3.Connection): Active database connection.
+        record_ids (Iterable[int]): Records whose rewrite failed.
+        max_attempts (int): Attempts before a record is given up on.
+        retry_delay (float): Seconds before a failed record is claimable again.
+    """
+    conn.executemany(
+        "UPDATE scraped_data SET rewrite_state = CASE WHEN rewrite_attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "rewrite_lease_until = ?, rewrite_owner = NULL WHERE id = ?;",
+        [(max_attempts, time.time() + retry_delay, record_id) for record_id in record_ids],
+    )
+
+
+def process_records(
+    conn: sqlite3.Connection,
+    concurrency: int = CONCURRENCY,
+    page_size: int = PAGE_SIZE,
+    commit_batch: int = COMMIT_BATCH,
+    cache: Optional[RewriteCache] = None,
+    chunk_tokens: int = CHUNK_TOKENS,
+    lease_seconds: float = LEASE_SECONDS,
+) -> None:
     """
     Process database records with no rewritten content:
-      - Fetch records where 'rewrite' is NULL or empty.
-      - Rewrite the markdown content using Ollama.
-      - Update the record with the rewritten text.
+      - Claim pending records in leased batches, so several rewriter
+        processes can share the queue and a crashed one's records are
+        picked up again once its leases expire.
+      - Split the markdown into chunks of consecutive paragraphs.
+      - Reuse the rewrite of chunks unchanged since the page's previous
+        rewrite, or a cached rewrite of identical chunks.
+      - Otherwise rewrite the chunks using Ollama, keeping up to
+        ``concurrency`` requests in flight across all records.
+      - Reassemble each record's chunks in order and write the rewritten
+        text back in batched transactions, keeping the chunks and their
+        rewrites as the page's segments for the next re-scrape.
+      - Requeue failed records for a later run, up to MAX_ATTEMPTS.
       
     Args:
         conn (sqlite3.Connection): Active database connection.
+        concurrency (int): Requests kept in flight against the Ollama server.
+        page_size (int): Pending rows claimed per query.
+        commit_batch (int): Rewrites written per transaction.
+        cache (RewriteCache, optional): Rewrite cache; one stored in the
+            same database is used by default.
+        chunk_tokens (int): Token budget per chunk.
+        lease_seconds (float): How long claimed records are reserved; the
+            leases are renewed while work on them continues.
     """
-    select_sql = "SELECT id, markdown FROM scraped_data WHERE rewrite IS NULL OR rewrite = '';"
-    records = conn.execute(select_sql).fetchall()
+    if cache is None:
+        cache = RewriteCache(conn)
+    create_segment_table(conn)
+    owner = worker_id()
+    in_flight = {}
+    # Record ID and chunk position waiting on each chunk, so duplicates
+    # already in flight share one request.
+    waiters = {}
+    # Source URL and chunks per record, their rewrites, and how many are
+    # still outstanding.
+    sources = {}
+    parts = {}
+    remaining = {}
+    # Claimed records not yet written back, whose leases must be renewed.
+    leased = set()
+    finished: List[Tuple[int, str]] = []
+    failed: List[int] = []
+    skipped: List[int] = []
+    segments: List[Tuple[str, List[str], List[str]]] = []
+    counts = {"rewritten": 0, "failed": 0, "reused": 0}
+    renew_at = time.monotonic() + lease_seconds / 3
 
-    if not records:
-        logger.info("No records to rewrite.")
-        return
+    def flush(threshold: int) -> None:
+        if not (finished or failed or skipped) or len(finished) + len(failed) + len(skipped) < threshold:
+            return
+        cache.write()
+        for source_url, chunks, rewrites in segments:
+            save_segments(conn, source_url, chunks, rewrites)
+        release_failed_records(conn, failed)
+        release_failed_records(conn, skipped, max_attempts=0)
+        update_rewrites_in_db(conn, finished)
+        if finished:
+            logger.info(f"Updated {len(finished)} record(s) with rewritten content.")
+        leased.difference_update(record_id for record_id, _ in finished)
+        leased.difference_update(failed)
+        leased.difference_update(skipped)
+        for pending in (finished, failed, skipped, segments):
+            pending.clear()
 
-    logger.info(f"Found {len(records)} record(s) to rewrite.")
-    for record_id, markdown in records:
-        logger.info(f"Rewriting content for record ID: {record_id}")
-        if not markdown:
-            logger.warning(f"Record ID {record_id} has empty markdown content, skipping.")
-            continue
+    def heartbeat() -> None:
+        nonlocal renew_at
+        if time.monotonic() >= renew_at and leased:
+            renew_leases(conn, owner, leased, lease_seconds)
+            renew_at = time.monotonic() + lease_seconds / 3
 
-        rewritten_content = rewrite_with_ollama(markdown)
-        if rewritten_content:
-            update_rewrite_in_db(conn, record_id, rewritten_content)
-            logger.info(f"Updated record ID {record_id} with rewritten content.")
+    def fill(record_id: int, index: int, rewritten: str) -> None:
+        parts[record_id][index] = rewritten
+        remaining[record_id] -= 1
+        if remaining[record_id]:
+            return
+        del remaining[record_id]
+        source_url, chunks = sources.pop(record_id)
+        rewrites = parts.pop(record_id)
+        if all(rewrites):
+            if source_url:
+                segments.append((source_url, chunks, rewrites))
+            finished.append((record_id, "\n\n".join(rewrites)))
+            counts["rewritten"] += 1
         else:
             logger.error(f"Failed to rewrite content for record ID {record_id}.")
+            failed.append(record_id)
+            counts["failed"] += 1
+        flush(commit_batch)
+
+    def collect(done) -> None:
+        for future in done:
+            chunk = in_flight.pop(future)
+            rewritten = future.result()
+            if rewritten:
+                cache.put(chunk, rewritten)
+            for record_id, index in waiters.pop(chunk):
+                fill(record_id, index, rewritten)
+        heartbeat()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rewriter") as pool:
+        while True:
+            batch = claim_pending_records(conn, owner, page_size, lease_seconds)
+            if not batch:
+                break
+            leased.update(record_id for record_id, _, _ in batch)
+            for record_id, source_url, markdown in batch:
+                if not markdown:
+                    logger.warning(f"Record ID {record_id} has empty markdown content, skipping.")
+                    skipped.append(record_id)
+                    continue
+                chunks = split_markdown(markdown, chunk_tokens)
+                if not chunks:
+                    logger.warning(f"Record ID {record_id} has only blank markdown content, skipping.")
+                    skipped.append(record_id)
+                    continue
+                previous = reuse_segments(conn, source_url, chunks) if source_url else [None] * len(chunks)
+                sources[record_id] = (source_url, chunks)
+                parts[record_id] = [""] * len(chunks)
+                remaining[record_id] = len(chunks)
+                logger.info(f"Rewriting content for record ID: {record_id} ({len(chunks)} chunk(s))")
+                for index, chunk in enumerate(chunks):
+                    if previous[index]:
+                        counts["reused"] += 1
+                        fill(record_id, index, previous[index])
+                        continue
+                    cached = cache.get(chunk)
+                    if cached is not None:
+                        fill(record_id, index, cached)
+                        continue
+                    if chunk in waiters:
+                        waiters[chunk].append((record_id, index))
+                        continue
+                    waiters[chunk] = [(record_id, index)]
+                    in_flight[pool.submit(rewrite_chunk, chunk)] = chunk
+                    if len(in_flight) >= concurrency:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+            flush(commit_batch)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    flush(1)
+    cache.evict()
+    if not counts["rewritten"] and not counts["failed"]:
+        logger.info("No records to rewrite.")
+    else:
+        logger.info(
+            f"Rewrote {counts['rewritten']} record(s); {counts['failed']} failed; "
+            f"{counts['reused']} unchanged segment(s) reused; cache hits/misses: {cache.hits}/{cache.misses}."
+        )
 
 
 def main() -> None:
@@ -89,6 +699,8 @@ def main() -> None:
     Main function to connect to the database, process records needing rewriting, and update them.
     """
     with sqlite3.connect(DB_FILE) as conn:
+        # Adds the rewrite-state columns and queue index to older databases.
+        create_table(conn)
         process_records(conn)
 
 
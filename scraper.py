@@ -1,16 +1,62 @@
 # file_path/scraper.py
 
+import os
+import html
+import math
+import heapq
+import hashlib
+import time
 import uuid
+import queue
 import logging
+import threading
 import cloudscraper
-from bs4 import BeautifulSoup
 import html2text
-from typing import Dict, Any
+import requests
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit
+from requests.cookies import RequestsCookieJar
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Default number of URLs scraped at the same time by a JobRunner.
+DEFAULT_CONCURRENCY = 16
+
+# Default limits for the per-host session pool.
+DEFAULT_MAX_SESSIONS = 64
+DEFAULT_SESSION_IDLE_TIMEOUT = 300.0
+
+# Default politeness limits applied to every host.
+DEFAULT_HOST_RATE = 2.0  # requests per second
+DEFAULT_HOST_BURST = 2
+DEFAULT_HOST_MAX_IN_FLIGHT = 2
+# Jobs a HostScheduler holds for hosts that cannot take them yet, on top of
+# its backlog, before submitting blocks.
+DEFAULT_MAX_PARKED = 10000
+
+# Statuses that ask us to slow down, how often a job is retried after one,
+# and the longest pause we honor from a Retry-After header.
+THROTTLE_STATUSES = (429, 503)
+MAX_THROTTLE_RETRIES = 3
+MAX_RETRY_AFTER = 300.0
+
+# A URL scraped successfully this many seconds ago is not scraped again.
+DEFAULT_FRESHNESS_TTL = 24 * 3600
+# Smallest Bloom filter layer, in bits (8 KiB).
+BLOOM_MIN_BITS = 1 << 16
+
+# Query parameters that only record where a visitor came from; URLs that
+# differ only in these point at the same page.
+TRACKING_PARAMS = frozenset({"gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_gl"})
+TRACKING_PARAM_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
 def convert_html_to_markdown(html: str) -> str:
     """
     Convert HTML content to Markdown using html2text.
@@ -25,6 +71,128 @@ def convert_html_to_markdown(html: str) -> str:
     converter.ignore_links = False
     return converter.handle(html)
 
+class _PageParser(html2text.HTML2Text):
+    """
+    html2text converter that collects page metadata while it converts.
+
+    Markdown conversion already tokenizes the whole document, so the title,
+    meta tags, Open Graph tags, links, images and JSON-LD blocks are picked
+    up from the same start tags and text instead of building a second,
+    BeautifulSoup tree and searching it once per field.
+    """
+
+    # Meta tags looked up by their name attribute.
+    META_NAMES = ("viewport", "description", "keywords")
+
+    def __init__(self):
+        super().__init__()
+        self.ignore_links = False
+        self.title: Optional[List[str]] = None
+        self.meta: Dict[str, Optional[str]] = {}
+        self.open_graph: Dict[str, str] = {}
+        self.links: List[str] = []
+        self.images: List[str] = []
+        self.structured_data: List[str] = []
+        self._in_title = False
+        self._title_seen = False
+        self._json_ld: Optional[List[str]] = None
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._in_title = False
+        if tag == "title":
+            if not self._title_seen:
+                self._title_seen = True
+                self._in_title = True
+                self.title = []
+        elif tag == "a" or tag == "img" or tag == "meta" or tag == "script":
+            # Valueless attributes come through as None; treat them as empty.
+            values = {name: value or "" for name, value in attrs}
+            if tag == "a":
+                if "href" in values:
+                    self.links.append(values["href"])
+            elif tag == "img":
+                if "src" in values:
+                    self.images.append(values["src"])
+            elif tag == "meta":
+                name = values.get("name")
+                if name in self.META_NAMES and name not in self.meta:
+                    self.meta[name] = values.get("content")
+                prop = values.get("property")
+                if prop and prop.startswith("og:"):
+                    self.open_graph[prop] = values.get("content", "")
+            elif values.get("type") == "application/ld+json":
+                self._json_ld = []
+        super().handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "title":
+            self._in_title = False
+        elif tag == "script" and self._json_ld is not None:
+            text = "".join(self._json_ld)
+            if text:
+                self.structured_data.append(text.strip())
+            self._json_ld = None
+        super().handle_endtag(tag)
+
+    def handle_data(self, data: str, entity_char: bool = False) -> None:
+        if not entity_char:
+            self._collect_text(data)
+        super().handle_data(data, entity_char)
+
+    def handle_charref(self, c: str) -> None:
+        self._collect_text(html.unescape(f"&#{c};"))
+        super().handle_charref(c)
+
+    def handle_entityref(self, c: str) -> None:
+        # html2text swaps some entities for placeholders, so decode them here.
+        self._collect_text(html.unescape(f"&{c};"))
+        super().handle_entityref(c)
+
+    def _collect_text(self, data: str) -> None:
+        if self._in_title:
+            self.title.append(data)
+        elif self._json_ld is not None:
+            self._json_ld.append(data)
+
+    def fields(self) -> Dict[str, Any]:
+        """
+        Return the collected metadata fields.
+
+        Returns:
+            dict: Title, viewport, description, keywords, Open Graph tags,
+                  links, images and structured data, shaped like the
+                  matching entries of ``extract_metadata``.
+        """
+        title = "".join(self.title) if self.title else ""
+        viewport = self.meta.get("viewport")
+        description = self.meta.get("description")
+        keywords = self.meta.get("keywords")
+        return {
+            "title": title.strip() if title else "No Title",
+            "viewport": viewport if viewport is not None else "width=device-width, initial-scale=1",
+            "meta_description": description.strip() if description is not None else "",
+            "meta_keywords": keywords.strip() if keywords is not None else "",
+            "open_graph": self.open_graph,
+            "links": self.links,
+            "images": self.images,
+            "structured_data": self.structured_data,
+        }
+
+def parse_html(html: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Convert HTML to Markdown and collect its metadata in a single parse.
+    
+    Args:
+        html (str): The HTML content to parse.
+        
+    Returns:
+        tuple: The Markdown text and a dict of metadata fields
+               (see ``_PageParser.fields``).
+    """
+    parser = _PageParser()
+    markdown = parser.handle(html)
+    return markdown, parser.fields()
+
 def extract_metadata(
     html: str,
     original_url: str,
@@ -32,10 +200,11 @@ def extract_metadata(
     status_code: int,
     scrape_id: str,
     headers: Dict[str, Any],
-    cookies: Dict[str, Any]
+    cookies: Dict[str, Any],
+    fields: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
-    Extract metadata from HTML content using BeautifulSoup, including additional info such as:
+    Extract metadata from HTML content, including additional info such as:
       - Meta description and keywords.
       - Open Graph tags.
       - All links and images.
@@ -50,133 +219,1064 @@ def extract_metadata(
         scrape_id (str): Unique identifier for the scrape.
         headers (dict): HTTP response headers.
         cookies (dict): Cookies from the response.
+        fields (dict, optional): Fields already collected by ``parse_html``;
+            the HTML is parsed again only when omitted.
         
     Returns:
         dict: A dictionary with extended metadata.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    title = soup.title.string.strip() if soup.title and soup.title.string else "No Title"
-    
-    viewport_meta = soup.find("meta", attrs={"name": "viewport"})
-    viewport = (
-        viewport_meta["content"]
-        if viewport_meta and viewport_meta.has_attr("content")
-        else "width=device-width, initial-scale=1"
-    )
-    
-    # Meta description
-    desc_meta = soup.find("meta", attrs={"name": "description"})
-    meta_description = desc_meta["content"].strip() if desc_meta and desc_meta.has_attr("content") else ""
-    
-    # Meta keywords
-    keywords_meta = soup.find("meta", attrs={"name": "keywords"})
-    meta_keywords = keywords_meta["content"].strip() if keywords_meta and keywords_meta.has_attr("content") else ""
-    
-    # Open Graph tags extraction
-    og_tags = {}
-    for meta in soup.find_all("meta", attrs={"property": True}):
-        prop = meta.get("property", "")
-        if prop.startswith("og:"):
-            og_tags[prop] = meta.get("content", "")
-    
-    # Extract all links (anchor href values)
-    links = [a.get("href") for a in soup.find_all("a", href=True)]
-    
-    # Extract all image sources
-    images = [img.get("src") for img in soup.find_all("img", src=True)]
-    
-    # Extract structured data (JSON-LD scripts)
-    structured_data = []
-    for script in soup.find_all("script", type="application/ld+json"):
-        try:
-            if script.string:
-                structured_data.append(script.string.strip())
-        except Exception:
-            pass
+    if fields is None:
+        _, fields = parse_html(html)
     
     return {
-        "title": title,
-        "viewport": viewport,
+        "title": fields["title"],
+        "viewport": fields["viewport"],
         "scrapeId": scrape_id,
         "sourceURL": original_url,
         "url": final_url,
         "statusCode": status_code,
         "html": html,
-        "meta_description": meta_description,
-        "meta_keywords": meta_keywords,
-        "open_graph": og_tags,
-        "links": links,
-        "images": images,
-        "structured_data": structured_data,
+        "meta_description": fields["meta_description"],
+        "meta_keywords": fields["meta_keywords"],
+        "open_graph": fields["open_graph"],
+        "links": fields["links"],
+        "images": fields["images"],
+        "structured_data": fields["structured_data"],
         "headers": headers,
         "cookies": cookies
     }
 
-def run_job(url: str) -> Dict[str, Any]:
+class SessionPool:
     """
-    Scrape the given URL and return its Markdown content along with extended metadata.
+    Reusable cloudscraper sessions keyed by scheme and host.
+
+    Each session is used by one job at a time and returned to the pool
+    afterwards, so its open connections are reused by the next job for the
+    same host. Cookies, including solved anti-bot clearance cookies, are
+    kept per host and copied into every new session created for it.
+    Sessions idle for longer than ``idle_timeout`` are closed, and at most
+    ``max_sessions`` idle sessions are kept open.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_timeout: float = DEFAULT_SESSION_IDLE_TIMEOUT,
+        factory: Callable[[], Any] = cloudscraper.create_scraper,
+    ):
+        """
+        Args:
+            max_sessions (int): Maximum number of idle sessions kept open.
+            idle_timeout (float): Seconds after which an idle session is closed.
+            factory (callable): Creates a new session.
+        """
+        self.max_sessions = max(1, int(max_sessions))
+        self.idle_timeout = idle_timeout
+        self._factory = factory
+        self._lock = threading.Lock()
+        # Idle sessions per host, least recently used host first.
+        self._idle: "OrderedDict[Tuple[str, str], List[Tuple[Any, float]]]" = OrderedDict()
+        self._idle_count = 0
+        self._busy: Dict[Tuple[str, str], int] = {}
+        self._cookies: Dict[Tuple[str, str], RequestsCookieJar] = {}
+
+    @contextmanager
+    def session(self, url: str) -> Iterator[Any]:
+        """
+        Check out a session for the host of ``url`` for the duration of a request.
+
+        Args:
+            url (str): The URL about to be fetched.
+
+        Yields:
+            The session to use.
+        """
+        key = _host_key(url)
+        session = self._checkout(key)
+        try:
+            yield session
+        finally:
+            self._checkin(key, session)
+
+    def close(self) -> None:
+        """Close every idle session and forget all stored cookies."""
+        with self._lock:
+            idle = [session for entries in self._idle.values() for session, _ in entries]
+            self._idle.clear()
+            self._idle_count = 0
+            self._cookies.clear()
+        for session in idle:
+            session.close()
+
+    def _checkout(self, key: Tuple[str, str]) -> Any:
+        with self._lock:
+            expired = self._evict_idle(time.monotonic())
+            self._busy[key] = self._busy.get(key, 0) + 1
+            entries = self._idle.get(key)
+            session = None
+            if entries:
+                session, _ = entries.pop()
+                self._idle_count -= 1
+                if not entries:
+                    del self._idle[key]
+            cookies = self._cookies.get(key)
+        for stale in expired:
+            stale.close()
+        if session is None:
+            session = self._factory()
+            if cookies:
+                session.cookies.update(cookies)
+        return session
+
+    def _checkin(self, key: Tuple[str, str], session: Any) -> None:
+        with self._lock:
+            self._busy[key] -= 1
+            if not self._busy[key]:
+                del self._busy[key]
+            self._cookies.setdefault(key, RequestsCookieJar()).update(session.cookies)
+            self._idle.setdefault(key, []).append((session, time.monotonic()))
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+            evicted = []
+            while self._idle_count > self.max_sessions:
+                evicted.append(self._pop_oldest())
+        for stale in evicted:
+            stale.close()
+
+    def _evict_idle(self, now: float) -> List[Any]:
+        evicted = []
+        for key in list(self._idle):
+            entries = self._idle[key]
+            fresh = [(s, used) for s, used in entries if now - used < self.idle_timeout]
+            evicted.extend(s for s, used in entries if now - used >= self.idle_timeout)
+            self._idle_count -= len(entries) - len(fresh)
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                self._drop_host(key)
+        return evicted
+
+    def _pop_oldest(self) -> Any:
+        key = next(iter(self._idle))
+        entries = self._idle[key]
+        session, _ = entries.pop(0)
+        self._idle_count -= 1
+        if not entries:
+            self._drop_host(key)
+        return session
+
+    def _drop_host(self, key: Tuple[str, str]) -> None:
+        self._idle.pop(key, None)
+        if key not in self._busy:
+            self._cookies.pop(key, None)
+
+def _host_key(url: str) -> Tuple[str, str]:
+    parts = urlsplit(url)
+    return parts.scheme.lower(), parts.netloc.lower()
+
+class _HostState:
+    """Pending jobs, token bucket and in-flight count for one host."""
+
+    __slots__ = ("pending", "tokens", "updated", "in_flight", "paused_until")
+
+    def __init__(self, burst: float, now: float):
+        self.pending: deque = deque()
+        self.tokens = burst
+        self.updated = now
+        self.in_flight = 0
+        self.paused_until = 0.0
+
+class HostScheduler:
+    """
+    Queue of pending jobs that hands them out host by host.
+
+    Every host gets a token bucket refilled at ``rate`` requests per second
+    (holding at most ``burst`` tokens) and a cap of ``max_in_flight``
+    concurrent requests. ``get`` round-robins over the hosts that currently
+    have both a token and a free slot, so a batch dominated by one host
+    cannot starve the others and no host sees more than its share. A host
+    that answers with a throttling status is paused for its Retry-After.
+
+    The backlog counts only the jobs each host could be sent next (the first
+    ``max_in_flight`` of its queue). Jobs behind those are parked without
+    counting, so a long run of URLs for one host does not stop ``put`` from
+    reaching the hosts after it; ``max_parked`` bounds how many pile up.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_HOST_RATE,
+        burst: float = DEFAULT_HOST_BURST,
+        max_in_flight: int = DEFAULT_HOST_MAX_IN_FLIGHT,
+        backlog: Optional[int] = None,
+        max_parked: int = DEFAULT_MAX_PARKED,
+    ):
+        """
+        Args:
+            rate (float): Requests per second allowed per host.
+            burst (float): Requests a host may receive back to back.
+            max_in_flight (int): Concurrent requests allowed per host.
+            backlog (int, optional): Jobs ready for their host held before
+                ``put`` blocks. Unbounded when omitted.
+            max_parked (int): Jobs held beyond the backlog for hosts that
+                already have enough queued, before ``put`` blocks.
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.backlog = backlog
+        self.max_parked = max(0, int(max_parked))
+        self._cond = threading.Condition()
+        self._hosts: Dict[str, _HostState] = {}
+        # Hosts with pending jobs, in round-robin order.
+        self._ring: deque = deque()
+        # (time its bucket is full again, host) for hosts with no work left.
+        self._idle: List[Tuple[float, str]] = []
+        self._pending = 0
+        # Pending jobs among the first max_in_flight of their host's queue.
+        self._ready = 0
+        self._in_flight = 0
+        self._closed = False
+
+    def put(self, host: str, job: Any, force: bool = False) -> None:
+        """
+        Queue a job for a host, blocking while the backlog is full.
+
+        Args:
+            host (str): The host the job will contact.
+            job: Opaque job object returned later by ``get``.
+            force (bool): Skip the backlog check; used for retries so a
+                worker never blocks on its own queue.
+        """
+        with self._cond:
+            while not force and self._full():
+                self._cond.wait()
+            self._forget_idle(time.monotonic())
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.burst, time.monotonic())
+            if not state.pending:
+                self._ring.append(host)
+            if len(state.pending) < self.max_in_flight:
+                self._ready += 1
+            state.pending.append(job)
+            self._pending += 1
+            self._cond.notify_all()
+
+    def set_limits(self, rate: float, burst: float, max_in_flight: int) -> None:
+        """
+        Change the per-host limits; queued and running jobs keep their place.
+
+        Args:
+            rate (float): Requests per second allowed per host.
+            burst (float): Requests a host may receive back to back.
+            max_in_flight (int): Concurrent requests allowed per host.
+        """
+        with self._cond:
+            now = time.monotonic()
+            for state in self._hosts.values():
+                self._refill(state, now)
+            self.rate = rate
+            self.burst = max(1.0, burst)
+            self.max_in_flight = max(1, int(max_in_flight))
+            for state in self._hosts.values():
+                state.tokens = min(state.tokens, self.burst)
+            self._ready = sum(min(len(state.pending), self.max_in_flight) for state in self._hosts.values())
+            self._cond.notify_all()
+
+    def get(self) -> Optional[Tuple[str, Any]]:
+        """
+        Wait for the next job whose host may be contacted now.
+
+        The caller must report back with ``done`` once the request finishes.
+
+        Returns:
+            tuple: ``(host, job)``, or None once the scheduler is closed and
+                   every job has been handed out and finished.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = None
+                for _ in range(len(self._ring)):
+                    host = self._ring[0]
+                    self._ring.rotate(-1)
+                    state = self._hosts[host]
+                    delay = self._delay(state, now)
+                    if delay <= 0:
+                        return self._take(host, state)
+                    if delay != float("inf"):
+                        wait = delay if wait is None else min(wait, delay)
+                if self._closed and not self._pending and not self._in_flight:
+                    return None
+                self._cond.wait(wait)
+
+    def done(self, host: str, retry_after: Optional[float] = None) -> None:
+        """
+        Report that a request handed out by ``get`` has finished.
+
+        Args:
+            host (str): The job's host.
+            retry_after (float, optional): Seconds the host asked us to back
+                off; pauses every pending job for that host.
+        """
+        with self._cond:
+            now = time.monotonic()
+            state = self._hosts[host]
+            state.in_flight -= 1
+            self._in_flight -= 1
+            if retry_after:
+                state.paused_until = max(state.paused_until, now + min(retry_after, MAX_RETRY_AFTER))
+                state.tokens = 0.0
+                state.updated = state.paused_until
+            if not state.pending and not state.in_flight:
+                refilled_at = max(now, state.paused_until) + (self.burst - state.tokens) / self.rate
+                heapq.heappush(self._idle, (refilled_at, host))
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Let ``get`` return None once every queued job has finished."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _full(self) -> bool:
+        if not self.backlog:
+            return False
+        return self._ready >= self.backlog or self._pending >= self.backlog + self.max_parked
+
+    def _delay(self, state: _HostState, now: float) -> float:
+        if state.in_flight >= self.max_in_flight:
+            return float("inf")  # woken up by done()
+        if now < state.paused_until:
+            return state.paused_until - now
+        self._refill(state, now)
+        if state.tokens >= 1.0:
+            return 0.0
+        return (1.0 - state.tokens) / self.rate
+
+    def _refill(self, state: _HostState, now: float) -> None:
+        if now > state.updated:
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+            state.updated = now
+
+    def _take(self, host: str, state: _HostState) -> Tuple[str, Any]:
+        state.tokens -= 1.0
+        state.in_flight += 1
+        job = state.pending.popleft()
+        if not state.pending:
+            self._ring.remove(host)
+        if len(state.pending) < self.max_in_flight:
+            # No parked job moved up to take its place.
+            self._ready -= 1
+        self._pending -= 1
+        self._in_flight += 1
+        self._cond.notify_all()
+        return host, job
+
+    def _forget_idle(self, now: float) -> None:
+        # A host with nothing queued or running and a full bucket behaves
+        # exactly like a new one, so its state can be dropped.
+        while self._idle and self._idle[0][0] <= now:
+            _, host = heapq.heappop(self._idle)
+            state = self._hosts.get(host)
+            if state is None or state.pending or state.in_flight or now < state.paused_until:
+                continue
+            self._refill(state, now)
+            if state.tokens >= self.burst - 1e-6:
+                del self._hosts[host]
+
+def _scheduler_host(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+def _throttle_delay(response: Optional[requests.Response], attempt: int) -> Optional[float]:
+    """Seconds to back off after a throttling response, or None for other errors."""
+    if response is None or response.status_code not in THROTTLE_STATUSES:
+        return None
+    retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+    return retry_after if retry_after is not None else 2.0 ** (attempt + 1)
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Shared by every job that does not bring its own pool.
+default_session_pool = SessionPool()
+
+class ScrapeStats:
+    """Thread-safe counters of processed, skipped (unchanged) and failed pages."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """
+        Count a finished ``run_job`` result.
+        
+        Args:
+            result (dict): The result to count.
+        """
+        if result.get("error"):
+            outcome = "failed"
+        elif result.get("not_modified"):
+            outcome = "skipped"
+        else:
+            outcome = "processed"
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Returns:
+            dict: Current ``processed``, ``skipped`` and ``failed`` counts.
+        """
+        with self._lock:
+            return {key: self._counts[key] for key in ("processed", "skipped", "failed")}
+
+# Counts every page finished by run_job or a JobRunner in this process.
+scrape_stats = ScrapeStats()
+
+def _is_tracking_param(pair: str) -> bool:
+    name = pair.split("=", 1)[0].lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+def canonicalize_url(url: str) -> str:
+    """
+    Reduce a URL to the form used to recognise duplicates.
+
+    The scheme and host are lowercased, a default port, the fragment and
+    tracking parameters are dropped, and a trailing slash is removed from
+    the path (an empty path becomes ``/``). The remaining query keeps its
+    order and encoding.
     
     Args:
-        url (str): The URL to scrape.
+        url (str): An absolute URL.
         
     Returns:
-        dict: Contains the Markdown content, metadata, and scrape_id.
-              On error, includes an error message.
+        str: The canonical URL; ``url`` itself (stripped) when it is already
+             canonical or not absolute.
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.netloc:
+        return url
+    scheme = parts.scheme.lower()
+    userinfo, _, host = parts.netloc.rpartition("@")
+    host = host.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and host.endswith(default_port):
+        host = host[: -len(default_port)]
+    netloc = f"{userinfo}@{host}" if userinfo else host
+    path = parts.path.rstrip("/") or "/"
+    query = parts.query
+    if query:
+        query = "&".join(pair for pair in query.split("&") if pair and not _is_tracking_param(pair))
+    canonical = urlunsplit((scheme, netloc, path, query, ""))
+    # Keep the caller's string when nothing changed, so indexes hold one copy.
+    return url if canonical == url else canonical
+
+def _next_prime(n: int) -> int:
+    while n < 2 or any(n % d == 0 for d in range(2, math.isqrt(n) + 1)):
+        n += 1
+    return n
+
+
+class BloomFilter:
     """
-    scraper = cloudscraper.create_scraper()
-    scrape_id = str(uuid.uuid4())
+    Approximate set of strings at a few bytes per entry, for seen-sets of
+    inputs too large to keep every URL.
+
+    Membership has no false negatives and false positives at about
+    ``error_rate``. Once ``capacity`` keys are in, a layer twice as large
+    with half the error rate is added, so the overall rate stays below
+    twice ``error_rate`` however many keys arrive. Not thread-safe.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 1e-6):
+        """
+        Args:
+            capacity (int): Keys the first layer is sized for.
+            error_rate (float): Target false positive rate.
+        """
+        self.error_rate = error_rate
+        self._layers: List[Tuple[bytearray, int, int]] = []
+        self._capacity = max(1, capacity)
+        self._count = 0
+        self._add_layer()
+
+    def _grow(self) -> None:
+        self._capacity *= 2
+        self._count = 0
+        self._add_layer()
+
+    def _add_layer(self) -> None:
+        rate = self.error_rate / 2 ** (len(self._layers) + 1)
+        # A prime size keeps every probe step coprime with it, so a key's
+        # probes never repeat a position. Probes are derived from two hashes,
+        # which collide too often in tiny tables; hence the minimum size.
+        size = _next_prime(max(BLOOM_MIN_BITS, math.ceil(-self._capacity * math.log(rate) / math.log(2) ** 2)))
+        hashes = max(1, round(size / self._capacity * math.log(2)))
+        self._layers.append((bytearray((size + 7) // 8), size, hashes))
+
+    @staticmethod
+    def _hash(key: str) -> Tuple[int, int]:
+        digest = hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def __contains__(self, key: str) -> bool:
+        h1, h2 = self._hash(key)
+        for bits, size, hashes in self._layers:
+            for i in range(hashes):
+                position = (h1 + i * h2) % size
+                if not bits[position >> 3] & (1 << (position & 7)):
+                    break
+            else:
+                return True
+        return False
+
+    def add(self, key: str) -> bool:
+        """
+        Add a key unless it is (probably) present already.
+        
+        Args:
+            key (str): The key.
+            
+        Returns:
+            bool: True if the key was added, False if it was seen before
+                  (or, at about ``error_rate``, wrongly looks seen).
+        """
+        if key in self:
+            return False
+        if self._count >= self._capacity:
+            self._grow()
+        h1, h2 = self._hash(key)
+        bits, size, hashes = self._layers[-1]
+        for i in range(hashes):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+        return True
+
+def conditional_headers(previous: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Build the validator headers for re-fetching a previously scraped page.
     
-    try:
-        response = scraper.get(url, timeout=10)
-        response.raise_for_status()  # Raise error for HTTP errors
+    Args:
+        previous (dict, optional): Stored state of the last scrape, with
+            optional ``etag`` and ``last_modified`` entries.
+        
+    Returns:
+        dict: ``If-None-Match``/``If-Modified-Since`` headers, possibly empty.
+    """
+    headers = {}
+    if previous:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+    return headers
+
+def content_hash(html: str) -> str:
+    """
+    Hash a page body, ignoring differences in whitespace.
+    
+    Args:
+        html (str): The page body.
         
+    Returns:
+        str: Hex digest identifying the normalized body.
+    """
+    normalized = " ".join(html.split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+def fetch_page(
+    url: str,
+    session_pool: Optional[SessionPool] = None,
+    previous: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Download a page; the I/O-bound first stage of a scrape.
+    
+    Args:
+        url (str): The URL to fetch.
+        session_pool (SessionPool, optional): Pool to borrow the HTTP session
+            from. Defaults to the module-wide pool.
+        previous (dict, optional): Stored state of the last scrape of this
+            URL; its validators make the request conditional and its
+            ``content_hash`` detects unchanged bodies.
+        
+    Returns:
+        dict: The requested and final URL, status code, HTML, headers,
+              cookies, a new scrape_id, the body's content hash and
+              whether the page is unchanged since ``previous`` (a 304 or
+              an identical hash), in which case the HTML is empty.
+              
+    Raises:
+        Exception: On network errors and HTTP error statuses.
+    """
+    pool = session_pool or default_session_pool
+    with pool.session(url) as session:
+        response = session.get(url, headers=conditional_headers(previous), timeout=10)
+    response.raise_for_status()  # Raise error for HTTP errors
+    
+    html_content = ""
+    digest = None
+    not_modified = response.status_code == 304
+    if not not_modified:
         html_content = response.text
-        markdown = convert_html_to_markdown(html_content)
+        digest = content_hash(html_content)
+        # Servers without validators still let us skip unchanged bodies.
+        not_modified = bool(previous) and previous.get("content_hash") == digest
+    
+    return {
+        "url": url,
+        "final_url": response.url,
+        "status_code": response.status_code,
+        "html": "" if not_modified else html_content,
+        "headers": dict(response.headers),
+        "cookies": response.cookies.get_dict(),
+        "scrape_id": str(uuid.uuid4()),
+        "content_hash": digest,
+        "not_modified": not_modified,
+    }
+
+def build_result(page: Dict[str, Any], markdown: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Assemble the ``run_job`` result from a fetched page and its parsed content.
+    
+    Args:
+        page (dict): The page returned by ``fetch_page``.
+        markdown (str): Markdown returned by ``parse_html``.
+        fields (dict): Metadata fields returned by ``parse_html``.
         
-        # Gather additional response data
-        headers = dict(response.headers)
-        cookies = response.cookies.get_dict()
+    Returns:
+        dict: Contains the Markdown content, metadata, and scrape_id.
+    """
+    metadata = extract_metadata(
+        page["html"],
+        page["url"],
+        page["final_url"],
+        page["status_code"],
+        page["scrape_id"],
+        page["headers"],
+        page["cookies"],
+        fields
+    )
+    
+    return {
+        "markdown": markdown,
+        "metadata": metadata,
+        "scrape_id": page["scrape_id"],
+        "content_hash": page["content_hash"],
+    }
+
+def _empty_metadata(url: str) -> Dict[str, Any]:
+    return {
+        "title": "",
+        "viewport": "",
+        "scrapeId": "",
+        "sourceURL": url,
+        "url": "",
+        "statusCode": None,
+        "html": "",
+        "meta_description": "",
+        "meta_keywords": "",
+        "open_graph": {},
+        "links": [],
+        "images": [],
+        "structured_data": [],
+        "headers": {},
+        "cookies": {}
+    }
+
+def not_modified_result(page: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the ``run_job`` result for a page that is unchanged since its last scrape.
+    
+    Nothing is parsed; callers keep using what they stored for the last scrape.
+    
+    Args:
+        page (dict): The unchanged page returned by ``fetch_page``.
         
-        metadata = extract_metadata(
-            html_content,
-            url,
-            response.url,
-            response.status_code,
-            scrape_id,
-            headers,
-            cookies
-        )
+    Returns:
+        dict: An empty result flagged with ``not_modified``.
+    """
+    metadata = _empty_metadata(page["url"])
+    metadata.update({
+        "scrapeId": page["scrape_id"],
+        "url": page["final_url"],
+        "statusCode": page["status_code"],
+        "headers": page["headers"],
+        "cookies": page["cookies"],
+    })
+    return {
+        "markdown": "",
+        "metadata": metadata,
+        "scrape_id": page["scrape_id"],
+        "not_modified": True,
+    }
+
+def error_result(url: str, error: Exception) -> Dict[str, Any]:
+    """
+    Build the ``run_job`` result for a scrape that failed.
+    
+    Args:
+        url (str): The URL that was being scraped.
+        error (Exception): The error that stopped the scrape.
         
-        return {
-            "markdown": markdown,
-            "metadata": metadata,
-            "scrape_id": scrape_id,
-        }
+    Returns:
+        dict: An empty result carrying the error message.
+    """
+    logger.error(f"Error scraping {url}: {error}", exc_info=error)
+    return {
+        "markdown": "",
+        "metadata": _empty_metadata(url),
+        "scrape_id": "",
+        "error": str(error),
+    }
+
+def run_job(
+    url: str,
+    session_pool: Optional[SessionPool] = None,
+    previous: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Scrape the given URL and return its Markdown content along with extended metadata.
+    
+    Args:
+        url (str): The URL to scrape.
+        session_pool (SessionPool, optional): Pool to borrow the HTTP session
+            from. Defaults to the module-wide pool.
+        previous (dict, optional): Stored state of the last scrape of this
+            URL, used to skip pages that have not changed.
         
+    Returns:
+        dict: Contains the Markdown content, metadata, scrape_id and the
+              content hash. On error, includes an error message. When the
+              page is unchanged since ``previous``, ``not_modified`` is set
+              and nothing else is filled in.
+    """
+    try:
+        page = fetch_page(url, session_pool, previous)
+        if page["not_modified"]:
+            result = not_modified_result(page)
+        else:
+            markdown, fields = parse_html(page["html"])
+            result = build_result(page, markdown, fields)
     except Exception as e:
-        logger.error(f"Error scraping {url}: {e}", exc_info=True)
-        return {
-            "markdown": "",
-            "metadata": {
-                "title": "",
-                "viewport": "",
-                "scrapeId": "",
-                "sourceURL": url,
-                "url": "",
-                "statusCode": None,
-                "html": "",
-                "meta_description": "",
-                "meta_keywords": "",
-                "open_graph": {},
-                "links": [],
-                "images": [],
-                "structured_data": [],
-                "headers": {},
-                "cookies": {}
-            },
-            "scrape_id": "",
-            "error": str(e),
-        }
+        result = error_result(url, e)
+    scrape_stats.record(result)
+    return result
+
+class _Job:
+    """A URL submitted to a JobRunner and everything needed to finish it."""
+
+    __slots__ = ("url", "future", "callback", "on_start", "previous", "attempt")
+
+    def __init__(self, url, future, callback, on_start, previous):
+        self.url = url
+        self.future = future
+        self.callback = callback
+        self.on_start = on_start
+        self.previous = previous
+        self.attempt = 0
+
+class JobRunner:
+    """
+    Fixed pool of worker threads that scrape URLs with bounded concurrency.
+
+    Every caller (the Flet app, the DB pollers, the batch scripts) submits
+    URLs to a runner instead of starting its own threads. Submissions block
+    once ``backlog`` URLs are ready for their hosts (plus a bounded number
+    parked behind hosts that already have enough queued), so feeding a huge
+    input runs in bounded memory. Waiting URLs are handed to the
+    workers by a ``HostScheduler``, which keeps every host within its
+    politeness limits and retries throttled requests after their Retry-After.
+
+    Scraping runs in two stages. Fetch threads download pages and hand them
+    to a bounded parse queue; parse threads feed that queue into a process
+    pool, so the CPU-bound HTML parsing scales with cores instead of
+    competing with the fetchers for the GIL. A full parse queue blocks the
+    fetchers until the parsers catch up.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        backlog: Optional[int] = None,
+        session_pool: Optional[SessionPool] = None,
+        parse_workers: Optional[int] = None,
+        parse_backlog: Optional[int] = None,
+        scheduler: Optional[HostScheduler] = None,
+        host_rate: float = DEFAULT_HOST_RATE,
+        host_burst: float = DEFAULT_HOST_BURST,
+        host_max_in_flight: int = DEFAULT_HOST_MAX_IN_FLIGHT,
+    ):
+        """
+        Args:
+            concurrency (int): Number of URLs fetched at the same time.
+            backlog (int, optional): Number of submitted URLs allowed to wait
+                for a worker while their host could take them; see
+                ``HostScheduler``. Defaults to four times the concurrency.
+            session_pool (SessionPool, optional): HTTP sessions shared by the
+                workers. Defaults to the module-wide pool.
+            parse_workers (int, optional): Number of parser processes.
+                Defaults to the number of CPUs; 0 parses in the fetch threads.
+            parse_backlog (int, optional): Number of fetched pages allowed to
+                wait for a parser. Defaults to twice the parser count.
+            scheduler (HostScheduler, optional): Per-host politeness
+                scheduler. Defaults to one with the ``host_*`` limits and
+                ``backlog``.
+            host_rate (float): Requests per second allowed per host.
+            host_burst (float): Requests a host may receive back to back.
+            host_max_in_flight (int): Concurrent requests allowed per host.
+        """
+        self.concurrency = max(1, int(concurrency))
+        self.session_pool = session_pool
+        if scheduler is None:
+            if backlog is None:
+                backlog = self.concurrency * 4
+            scheduler = HostScheduler(host_rate, host_burst, host_max_in_flight, backlog=max(1, backlog))
+        self.scheduler = scheduler
+        if parse_workers is None:
+            parse_workers = os.cpu_count() or 1
+        self.parse_workers = max(0, int(parse_workers))
+        self._parse_pool = None
+        self._parsers = []
+        if self.parse_workers:
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+            if parse_backlog is None:
+                parse_backlog = self.parse_workers * 2
+            self._parse_queue: "queue.Queue" = queue.Queue(maxsize=max(1, parse_backlog))
+            for index in range(self.parse_workers):
+                parser = threading.Thread(target=self._parse_loop, name=f"parser-{index}", daemon=True)
+                parser.start()
+                self._parsers.append(parser)
+        self._workers = []
+        for index in range(self.concurrency):
+            worker = threading.Thread(target=self._work, name=f"scraper-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(
+        self,
+        url: str,
+        callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        on_start: Optional[Callable[[str], None]] = None,
+        previous: Optional[Dict[str, Any]] = None,
+    ) -> Future:
+        """
+        Queue a URL for scraping, blocking while the backlog is full.
+
+        Args:
+            url (str): The URL to scrape.
+            callback (callable, optional): Called as ``callback(url, result)``
+                from the worker thread once the job finishes.
+            on_start (callable, optional): Called as ``on_start(url)`` when a
+                worker picks the job up.
+            previous (dict, optional): Stored state of the last scrape of
+                this URL; see ``run_job``.
+
+        Returns:
+            Future: Resolves to the ``run_job`` result.
+        """
+        future: Future = Future()
+        self.scheduler.put(_scheduler_host(url), _Job(url, future, callback, on_start, previous))
+        return future
+
+    def map(
+        self,
+        urls: Iterable[str],
+        previous: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Scrape every URL and yield ``(url, result)`` pairs as they finish.
+
+        The input is consumed lazily by a feeder thread, so generators of any
+        size can be passed in. Results come back in completion order.
+
+        Args:
+            urls (iterable): URLs to scrape.
+            previous (callable, optional): Returns the stored state of the
+                last scrape of a URL, or None; called from the feeder thread.
+
+        Yields:
+            tuple: The URL and its ``run_job`` result.
+        """
+        # Finished pages not yet handed to the caller stall the feeder once
+        # there are enough of them, so a slow consumer cannot pile them up in
+        # memory. Jobs still queued are bounded by the scheduler instead, so
+        # a long run of one host's URLs does not hold back the others.
+        limit = self.concurrency * 4
+        finished: "queue.Queue" = queue.Queue()
+        consumed = threading.Condition()
+        stopped = threading.Event()
+        submitted = []
+
+        def feed() -> None:
+            count = 0
+            try:
+                for url in urls:
+                    with consumed:
+                        while finished.qsize() >= limit and not stopped.is_set():
+                            consumed.wait()
+                    if stopped.is_set():
+                        break
+                    self.submit(
+                        url,
+                        callback=lambda u, r: finished.put((u, r)),
+                        previous=previous(url) if previous else None,
+                    )
+                    count += 1
+            finally:
+                submitted.append(count)
+                finished.put(None)
+
+        threading.Thread(target=feed, name="scraper-feeder", daemon=True).start()
+        received = 0
+        try:
+            while not submitted or received < submitted[0]:
+                item = finished.get()
+                if item is None:
+                    continue
+                received += 1
+                with consumed:
+                    consumed.notify()
+                yield item
+        finally:
+            stopped.set()
+            with consumed:
+                consumed.notify()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the workers once the queued jobs are done.
+
+        Args:
+            wait (bool): Block until every worker has exited; otherwise the
+                pipeline drains in the background.
+        """
+        self.scheduler.close()
+        if wait:
+            self._drain()
+        else:
+            threading.Thread(target=self._drain, name="scraper-shutdown", daemon=True).start()
+
+    def _drain(self) -> None:
+        for worker in self._workers:
+            worker.join()
+        for _ in self._parsers:
+            self._parse_queue.put(None)
+        for parser in self._parsers:
+            parser.join()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True)
+
+    def _work(self) -> None:
+        while True:
+            entry = self.scheduler.get()
+            if entry is None:
+                return
+            host, job = entry
+            if not job.attempt and not job.future.set_running_or_notify_cancel():
+                self.scheduler.done(host)
+                continue
+            try:
+                if job.on_start and not job.attempt:
+                    job.on_start(job.url)
+                page = fetch_page(job.url, self.session_pool, job.previous)
+            except requests.HTTPError as e:
+                retry_after = _throttle_delay(e.response, job.attempt)
+                self.scheduler.done(host, retry_after)
+                if retry_after is not None and job.attempt < MAX_THROTTLE_RETRIES:
+                    logger.warning(f"{host} throttled {job.url}; retrying in {retry_after:.0f}s")
+                    job.attempt += 1
+                    self.scheduler.put(host, job, force=True)
+                else:
+                    self._finish(job, error_result(job.url, e))
+                continue
+            except Exception as e:
+                self.scheduler.done(host)
+                self._finish(job, error_result(job.url, e))
+                continue
+            self.scheduler.done(host)
+            if page["not_modified"]:
+                self._finish(job, not_modified_result(page))
+                continue
+            if self._parse_pool is not None:
+                self._parse_queue.put((job, page))
+                continue
+            try:
+                markdown, fields = parse_html(page["html"])
+                result = build_result(page, markdown, fields)
+            except Exception as e:
+                result = error_result(job.url, e)
+            self._finish(job, result)
+
+    def _parse_loop(self) -> None:
+        while True:
+            entry = self._parse_queue.get()
+            if entry is None:
+                return
+            job, page = entry
+            try:
+                markdown, fields = self._parse_pool.submit(parse_html, page["html"]).result()
+                result = build_result(page, markdown, fields)
+            except Exception as e:
+                result = error_result(page["url"], e)
+            self._finish(job, result)
+
+    def _finish(self, job: _Job, result: Dict[str, Any]) -> None:
+        scrape_stats.record(result)
+        job.future.set_result(result)
+        if job.callback:
+            try:
+                job.callback(job.url, result)
+            except Exception as e:
+                logger.error(f"Error in job callback for {job.url}: {e}", exc_info=True)
+
+def run_jobs(
+    urls: Iterable[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    runner: Optional[JobRunner] = None,
+    parse_workers: Optional[int] = None,
+    previous: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Scrape many URLs with bounded concurrency, yielding results as they finish.
+
+    Args:
+        urls (iterable): URLs to scrape; consumed lazily.
+        concurrency (int): Number of URLs scraped at the same time. Ignored
+            when ``runner`` is given.
+        runner (JobRunner, optional): Shared runner to use instead of a
+            private one.
+        parse_workers (int, optional): Parser processes for the private
+            runner; see ``JobRunner``.
+        previous (callable, optional): Looks up the stored state of the last
+            scrape of a URL so it is re-fetched conditionally.
+
+    Yields:
+        tuple: ``(url, result)`` for each URL, in completion order.
+    """
+    own_runner = runner is None
+    if own_runner:
+        runner = JobRunner(concurrency, parse_workers=parse_workers)
+    try:
+        yield from runner.map(urls, previous)
+    finally:
+        if own_runner:
+            runner.shutdown(wait=False)
 
 if __name__ == "__main__":
     # For quick testing purposes